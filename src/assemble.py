@@ -1,6 +1,5 @@
 import os
 import json
-from video_editor import VideoEditor
 
 def assemble():
     print("=== Manga Recap Assembler ===")
@@ -39,6 +38,8 @@ def assemble():
         print("No clips to assemble.")
         return
 
+    # Rendering dependencies are only loaded once there is something to render
+    from video_editor import VideoEditor
     editor = VideoEditor()
     output_name = f"{project_data['pdf_name']}_recap.mp4"
     editor.create_video(assembly_data, output_filename=output_name)
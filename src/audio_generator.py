@@ -1,24 +1,108 @@
 import os
 import mimetypes
-import struct
+import threading
 import dotenv
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Iterator, List, Optional, Tuple
 from google import genai
 from google.genai import types
+from rate_limiter import RateLimiter
+from cache import BlobCache, text_sha256
+from wav_writer import StreamingWavWriter
+from instrumentation import Span, span
 
 dotenv.load_dotenv()
 
 class AudioGenerator:
-    def __init__(self, api_key=None):
+    def __init__(self, api_key=None, requests_per_minute: float = 10, max_workers: int = 4,
+                 rate_limiter: Optional[RateLimiter] = None, cache_dir: Optional[str] = "data/cache/tts",
+                 cache_max_bytes: int = 2 * 1024 ** 3, client: Optional[genai.Client] = None):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
+        if client is None and not self.api_key:
             raise ValueError("GEMINI_API_KEY must be set")
-        self.client = genai.Client(api_key=self.api_key)
+        # A client can be shared with other agents (see batch.py)
+        self.client = client or genai.Client(api_key=self.api_key)
         self.model_id = "gemini-2.5-flash-preview-tts"
+        # One worker pool per generator: concurrent batches (e.g. several chapters) share it
+        self.max_workers = max_workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        # Pass a shared limiter when several generators draw on the same quota
+        self.rate_limiter = rate_limiter or RateLimiter(requests_per_minute)
+        # Synthesized audio keyed by (script, style, voice, model); cache_dir=None disables it
+        self.cache = BlobCache(cache_dir, max_bytes=cache_max_bytes, suffix=".wav") if cache_dir else None
+
+    def generate_batch(self, jobs: List[dict], max_workers: Optional[int] = None) -> List[Optional[str]]:
+        """
+        Generates audio for many segments concurrently, paced by the rate limiter.
+        jobs: List of keyword-argument dicts for generate_audio
+              (script_text, style_text, output_path and optionally voice_name).
+        Returns the output paths in job order; failed jobs yield None.
+        """
+        results = [None] * len(jobs)
+        for index, result in self.iter_batch(jobs, max_workers):
+            results[index] = result
+        return results
+
+    def iter_batch(self, jobs: List[dict], max_workers: Optional[int] = None) -> Iterator[Tuple[int, Optional[str]]]:
+        """
+        Like generate_batch, but yields (job_index, output_path_or_None) as each job finishes,
+        so callers can checkpoint or start downstream work early.
+        """
+        if max_workers:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = {pool.submit(self._run_job, job): index for index, job in enumerate(jobs)}
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            return
+
+        futures = {self.submit(job): index for index, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+    def submit(self, job: dict) -> Future:
+        """
+        Starts one generate_audio job on the shared worker pool.
+        The future resolves to the output path, or None if the job failed.
+        """
+        return self._executor().submit(self._run_job, job)
+
+    def _run_job(self, job: dict) -> Optional[str]:
+        try:
+            return self.generate_audio(**job)
+        except Exception as e:
+            print(f"Error generating audio for {job['output_path']}: {e}")
+            return None
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tts")
+            return self._pool
+
+    def close(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
 
     def generate_audio(self, script_text: str, style_text: str, output_path: str, voice_name: str = "Achird", max_retries: int = 3):
         """
         Generates audio for a given script and style, and saves it to output_path.
+        Identical requests from earlier runs are served from the audio cache without an API call.
         """
+        with span("tts.generate", output=output_path, bytes_in=len(script_text.encode("utf-8"))) as s:
+            return self._generate_audio(script_text, style_text, output_path, voice_name, max_retries, s)
+
+    def _generate_audio(self, script_text: str, style_text: str, output_path: str, voice_name: str,
+                        max_retries: int, s: Span):
+        cache_key = text_sha256(script_text, style_text, voice_name, self.model_id)
+        if self.cache and self.cache.fetch(cache_key, output_path):
+            print(f"Audio cache hit: {output_path}")
+            s.set(cache_hit=True)
+            return output_path
+        s.set(cache_hit=False)
+
         print(f"Generating audio for script: {script_text[:50]}...")
         
         prompt = f"STYLE: {style_text}\n\nTEXT TO SPEAK: {script_text}"
@@ -35,78 +119,53 @@ class AudioGenerator:
             ),
         )
 
-        for attempt in range(max_retries):
-            try:
-                audio_data = b""
-                mime_type = "audio/wav" # Default
-
-                for chunk in self.client.models.generate_content_stream(
-                    model=self.model_id,
-                    contents=prompt,
-                    config=generate_content_config,
-                ):
-                    if (chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts):
-                        part = chunk.candidates[0].content.parts[0]
-                        if part.inline_data:
-                            audio_data += part.inline_data.data
-                            if part.inline_data.mime_type:
-                                mime_type = part.inline_data.mime_type
-
-                if not audio_data:
-                    raise Exception("No audio data received from Gemini")
-
-                # Handle WAV header if needed
-                if "audio/L16" in mime_type or not output_path.endswith(".wav"):
-                    final_data = self._convert_to_wav(audio_data, mime_type)
-                else:
-                    final_data = audio_data
-
-                with open(output_path, "wb") as f:
-                    f.write(final_data)
-                
-                print(f"Audio saved to: {output_path}")
-                return output_path
-
-            except Exception as e:
-                error_msg = str(e)
-                if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
-                    wait_time = 10 * (attempt + 1) # Exponential backoff
-                    print(f"\nQuota exceeded for audio. Retrying in {wait_time}s... (Attempt {attempt + 1}/{max_retries})")
-                    import time
-                    time.sleep(wait_time)
-                else:
-                    raise e
-        
-        raise Exception(f"Failed to generate audio after {max_retries} attempts.")
+        data_size = self.rate_limiter.call_with_backoff(
+            lambda: self._stream_audio(prompt, generate_content_config, output_path), "audio", max_retries, span=s)
+        s.set(bytes_out=data_size)
+        if self.cache:
+            self.cache.store(cache_key, output_path)
+
+        print(f"Audio saved to: {output_path}")
+        return output_path
 
-    def _convert_to_wav(self, audio_data: bytes, mime_type: str) -> bytes:
+    def _stream_audio(self, prompt: str, config: types.GenerateContentConfig, output_path: str) -> int:
+        """
+        One streamed TTS call written to output_path. Returns the number of audio bytes.
+        """
+        # Chunks are appended to disk as they arrive; the WAV sizes are patched on close.
+        # Write then rename: output_path may be a hardlink into the cache, never truncate it
+        tmp_path = f"{output_path}.part"
+        writer = None
+        try:
+            for chunk in self.client.models.generate_content_stream(
+                model=self.model_id,
+                contents=prompt,
+                config=config,
+            ):
+                if (chunk.candidates and chunk.candidates[0].content and chunk.candidates[0].content.parts):
+                    part = chunk.candidates[0].content.parts[0]
+                    if part.inline_data and part.inline_data.data:
+                        if writer is None:
+                            writer = self._open_writer(tmp_path, output_path, part.inline_data.mime_type or "audio/wav")
+                        writer.write(part.inline_data.data)
+        finally:
+            if writer:
+                writer.close()
+
+        if writer is None or writer.data_size == 0:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise Exception("No audio data received from Gemini")
+
+        os.replace(tmp_path, output_path)
+        return writer.data_size
+
+    def _open_writer(self, tmp_path: str, output_path: str, mime_type: str) -> StreamingWavWriter:
+        # Raw PCM (audio/L16) gets a WAV header; an audio/wav container is written as-is
+        is_pcm = "audio/L" in mime_type or not output_path.endswith(".wav")
         parameters = self._parse_audio_mime_type(mime_type)
-        bits_per_sample = parameters["bits_per_sample"]
-        sample_rate = parameters["rate"]
-        num_channels = 1
-        data_size = len(audio_data)
-        bytes_per_sample = bits_per_sample // 8
-        block_align = num_channels * bytes_per_sample
-        byte_rate = sample_rate * block_align
-        chunk_size = 36 + data_size
-
-        header = struct.pack(
-            "<4sI4s4sIHHIIHH4sI",
-            b"RIFF",
-            chunk_size,
-            b"WAVE",
-            b"fmt ",
-            16,
-            1,
-            num_channels,
-            sample_rate,
-            byte_rate,
-            block_align,
-            bits_per_sample,
-            b"data",
-            data_size
-        )
-        return header + audio_data
+        return StreamingWavWriter(tmp_path, sample_rate=parameters["rate"],
+                                  bits_per_sample=parameters["bits_per_sample"], write_header=is_pcm)
 
     def _parse_audio_mime_type(self, mime_type: str) -> dict:
         bits_per_sample = 16
@@ -0,0 +1,100 @@
+import io
+import os
+import numpy as np
+from typing import Dict, Optional
+from cache import BlobCache, file_sha256, text_sha256
+from ffmpeg_tools import decode_audio
+from wav_writer import StreamingWavWriter
+
+
+class AudioMixer:
+    """
+    Mixes narration with looped, ducked background music as NumPy arrays.
+    Music tracks are decoded once per mixer and kept as float32 arrays, so every
+    segment sharing a mood reuses the same decoded samples. With a cache_dir the decoded
+    tracks are also stored as .npy files, which other mixers (e.g. in render worker
+    processes) memory-map instead of decoding the track again.
+    """
+
+    def __init__(self, sample_rate: int = 44100, channels: int = 2, music_gain: float = 0.20,
+                 cache_dir: Optional[str] = None, cache_max_bytes: int = 1024 ** 3):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.music_gain = music_gain
+        self._tracks: Dict[str, np.ndarray] = {}
+        # Decoded tracks keyed by (file content, sample rate, channels); cache_dir=None disables it
+        self.cache = BlobCache(cache_dir, max_bytes=cache_max_bytes, suffix=".npy") if cache_dir else None
+
+    def load_track(self, path: str) -> np.ndarray:
+        if path not in self._tracks:
+            self._tracks[path] = self._load_cached(path) if self.cache else self._decode(path)
+        return self._tracks[path]
+
+    def track_key(self, path: str) -> str:
+        return text_sha256(file_sha256(path), self.sample_rate, self.channels)
+
+    def _decode(self, path: str) -> np.ndarray:
+        return decode_audio(path, self.sample_rate, self.channels)
+
+    def _load_cached(self, path: str) -> np.ndarray:
+        key = self.track_key(path)
+        cache_path = self.cache.path_for(key)
+        try:
+            os.utime(cache_path)
+            return np.load(cache_path, mmap_mode="r")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"Warning: re-decoding {path}, unreadable cached track {cache_path}: {e}")
+
+        samples = self._decode(path)
+        buffer = io.BytesIO()
+        np.save(buffer, samples)
+        self.cache.store_bytes(key, buffer.getvalue())
+        return samples
+
+    def mix(self, voice_path: str, music_path: Optional[str] = None) -> np.ndarray:
+        """
+        Returns voice + music_gain * music, the music tiled sample-accurately to the voice length.
+        """
+        voice = decode_audio(voice_path, self.sample_rate, self.channels)
+        if not music_path:
+            return voice
+
+        try:
+            music = self.load_track(music_path)
+        except Exception as e:
+            print(f"Error loading music {music_path}: {e}")
+            return voice
+        if len(music) == 0:
+            return voice
+
+        # Loop if music is shorter than the narration, then cut to length
+        repeats = -(-len(voice) // len(music))
+        looped = np.tile(music, (repeats, 1))[:len(voice)]
+        mixed = voice + looped * np.float32(self.music_gain)
+        np.clip(mixed, -1.0, 1.0, out=mixed)
+        return mixed
+
+    def duration(self, samples: np.ndarray) -> float:
+        return len(samples) / self.sample_rate
+
+    def wav_writer(self, path: str) -> StreamingWavWriter:
+        """
+        16-bit PCM WAV writer at the mixer's format; feed it with to_pcm() chunks, so a long
+        soundtrack is written batch by batch instead of concatenated in memory.
+        """
+        return StreamingWavWriter(path, sample_rate=self.sample_rate, bits_per_sample=16,
+                                  num_channels=self.channels)
+
+    @staticmethod
+    def to_pcm(samples: np.ndarray) -> bytes:
+        return (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2").tobytes()
+
+    def write_wav(self, samples: np.ndarray, path: str) -> str:
+        """
+        Writes float samples in [-1, 1] as a 16-bit PCM WAV.
+        """
+        with self.wav_writer(path) as writer:
+            writer.write(self.to_pcm(samples))
+        return path
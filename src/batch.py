@@ -0,0 +1,202 @@
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+import dotenv
+from pipeline import RecapPipeline
+from rate_limiter import RateLimiter
+from ffmpeg_tools import ENCODER_PROFILES, DEFAULT_ENCODER_PROFILE
+from cache import save_json_atomic
+from instrumentation import tracer
+from workers import process_pool
+
+dotenv.load_dotenv()
+
+
+def load_pdf_list(source: str) -> List[str]:
+    """
+    PDF paths from a directory (its *.pdf files, sorted), a JSON manifest (a list of paths,
+    {"pdfs": [...]} or a list of {"pdf_path": ...}) or a CSV manifest (a `pdf_path` column,
+    else the first column). Relative paths in a manifest are resolved against its directory.
+    """
+    if os.path.isdir(source):
+        return [os.path.join(source, name) for name in sorted(os.listdir(source))
+                if name.lower().endswith(".pdf")]
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    if source.lower().endswith(".json"):
+        with open(source, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get("pdfs", [])
+        paths = [entry["pdf_path"] if isinstance(entry, dict) else entry for entry in data]
+    elif source.lower().endswith(".csv"):
+        with open(source, "r", encoding="utf-8", newline="") as f:
+            rows = list(csv.reader(f))
+        if rows and "pdf_path" in rows[0]:
+            column = rows[0].index("pdf_path")
+            rows = rows[1:]
+        else:
+            column = 0
+        paths = [row[column].strip() for row in rows if len(row) > column and row[column].strip()]
+    else:
+        raise ValueError(f"Unsupported batch source: {source} (expected a directory, .json or .csv)")
+
+    return [p if os.path.isabs(p) else os.path.join(base_dir, p) for p in paths]
+
+
+class BatchRunner:
+    """
+    Runs RecapPipeline over many chapters with shared resources: one genai client and one
+    Tavily client, one TTS rate limiter and worker pool for the whole API quota, one render
+    process pool, and semaphores bounding how many chapters extract or analyze at once.
+
+    A failing chapter is recorded and the others carry on.
+    """
+
+    def __init__(self, pdf_paths: List[str], resume: bool = False, refresh_analysis: bool = False,
+                 chapters: int = 2, render_workers: int = None, tts_requests_per_minute: float = 10, tts_workers: int = 4,
+                 analysis_slots: int = 2, extract_slots: int = 1, encoder_profile: str = DEFAULT_ENCODER_PROFILE):
+        self.pdf_paths = pdf_paths
+        self.resume = resume
+        self.refresh_analysis = refresh_analysis
+        self.chapters = max(1, chapters)
+        self.render_workers = render_workers or os.cpu_count() or 1
+        self.tts_requests_per_minute = tts_requests_per_minute
+        self.tts_workers = tts_workers
+        self.encoder_profile = encoder_profile
+        self.stage_slots = {
+            # PDF rasterization already uses every core; analysis is bounded by the Gemini quota
+            "extract": threading.Semaphore(max(1, extract_slots)),
+            "analyze": threading.Semaphore(max(1, analysis_slots)),
+        }
+        self.results: List[dict] = []
+
+    def run(self) -> List[dict]:
+        # API clients are imported here, not at module level, so --help and bad arguments return at once
+        from google import genai
+        from tavily import TavilyClient
+        from vision_agent import VisionAgent
+        from audio_generator import AudioGenerator
+        from context_agent import ContextAgent
+
+        gemini_client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+        tavily_key = os.getenv("TAVILY_API_KEY")
+        self.vision_agent = VisionAgent(client=gemini_client)
+        self.context_agent = ContextAgent(client=TavilyClient(api_key=tavily_key) if tavily_key else None)
+        self.audio_gen = AudioGenerator(client=gemini_client, max_workers=self.tts_workers,
+                                        rate_limiter=RateLimiter(self.tts_requests_per_minute))
+
+        print(f"Batch: {len(self.pdf_paths)} chapters, {self.chapters} at a time")
+        try:
+            with process_pool(self.render_workers) as render_pool, \
+                    ThreadPoolExecutor(max_workers=self.chapters, thread_name_prefix="chapter") as chapters:
+                self.render_pool = render_pool
+                self.results = list(chapters.map(self._run_chapter, self.pdf_paths))
+        finally:
+            self.audio_gen.close()
+        return self.results
+
+    def _run_chapter(self, pdf_path: str) -> dict:
+        pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        result = {"pdf_path": pdf_path, "status": "failed", "output": None, "error": None}
+        start = time.monotonic()
+        try:
+            if not os.path.exists(pdf_path):
+                raise FileNotFoundError(f"File {pdf_path} not found")
+            pipeline = RecapPipeline(
+                pdf_path,
+                resume=self.resume,
+                refresh_analysis=self.refresh_analysis,
+                # Per-chapter audio and project files, so chapters never overwrite each other
+                audio_dir=os.path.join("data", "audio", pdf_name),
+                project_file=os.path.join("config", "projects", f"{pdf_name}.json"),
+                render_workers=self.render_workers,
+                encoder_profile=self.encoder_profile,
+                vision_agent=self.vision_agent,
+                audio_gen=self.audio_gen,
+                context_agent=self.context_agent,
+                render_pool=self.render_pool,
+                stage_slots=self.stage_slots,
+            )
+            result["output"] = pipeline.run()
+            result["status"] = "done" if result["output"] else "empty"
+        except Exception as e:
+            print(f"Error processing {pdf_path}: {e}")
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["elapsed"] = round(time.monotonic() - start, 1)
+        return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Manga Recap Generator (Batch)")
+    parser.add_argument("source", help="Directory of PDFs, or a JSON/CSV manifest listing them")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip stages already completed for each chapter in a previous run")
+    parser.add_argument("--refresh-analysis", action="store_true",
+                        help="Ignore cached vision analyses and run them again")
+    parser.add_argument("--chapters", type=int, default=2,
+                        help="Chapters processed concurrently")
+    parser.add_argument("--render-workers", type=int, default=None,
+                        help="Processes in the shared segment render pool (default: CPU count)")
+    parser.add_argument("--tts-rpm", type=float, default=10,
+                        help="Maximum TTS requests per minute, across all chapters")
+    parser.add_argument("--tts-workers", type=int, default=4,
+                        help="Concurrent TTS requests, across all chapters")
+    parser.add_argument("--analysis-slots", type=int, default=2,
+                        help="Chapters analyzed by Gemini at the same time")
+    parser.add_argument("--encoder-profile", choices=sorted(ENCODER_PROFILES), default=DEFAULT_ENCODER_PROFILE,
+                        help="x264 settings for the video encode (see ffmpeg_tools.ENCODER_PROFILES)")
+    parser.add_argument("--report", default=os.path.join("output", "batch_report.json"),
+                        help="Where to write the per-chapter JSON report")
+    parser.add_argument("--trace", default=None,
+                        help="Also write a Chrome trace of the whole batch to this path")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print("=== Manga Recap Generator (Batch) ===")
+
+    try:
+        pdf_paths = load_pdf_list(args.source)
+    except (OSError, ValueError) as e:
+        print(f"Error: cannot read batch source {args.source}: {e}")
+        return 1
+    if not pdf_paths:
+        print(f"Error: no PDFs found in {args.source}")
+        return 1
+
+    runner = BatchRunner(
+        pdf_paths,
+        resume=args.resume,
+        refresh_analysis=args.refresh_analysis,
+        chapters=args.chapters,
+        render_workers=args.render_workers,
+        tts_requests_per_minute=args.tts_rpm,
+        tts_workers=args.tts_workers,
+        analysis_slots=args.analysis_slots,
+        encoder_profile=args.encoder_profile,
+    )
+    results = runner.run()
+    # Chapters run concurrently, so the timing spans are reported for the batch as a whole
+    save_json_atomic(args.report, dict(tracer.report(), chapters=results))
+    if args.trace:
+        tracer.write_chrome_trace(args.trace)
+
+    print("\n=== Batch Summary ===")
+    for result in results:
+        detail = result["output"] or result["error"] or ""
+        print(f"[{result['status']}] {result['pdf_path']} ({result['elapsed']}s) {detail}")
+    failed = [r for r in results if r["status"] == "failed"]
+    print(f"{len(results) - len(failed)}/{len(results)} chapters completed. Report: {args.report}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,149 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from typing import Any, Iterable
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Returns the hex SHA-256 of a file's content, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_sha256(*parts: Any) -> str:
+    """
+    Returns the hex SHA-256 of the given values, serialized as canonical JSON.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_json(path: str, default: Any = None) -> Any:
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable cache file {path}: {e}")
+        return default
+
+
+def save_json_atomic(path: str, data: Any):
+    """
+    Writes JSON to a temp file then renames it, so readers never see a half-written file.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def save_bytes_atomic(path: str, data: bytes):
+    """
+    Binary counterpart of save_json_atomic.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def link_or_copy(src_path: str, dest_path: str):
+    """
+    Hardlinks src to dest (replacing dest), falling back to a copy across filesystems.
+    Writers must replace files rather than truncate them, since a link shares the inode.
+    """
+    os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+    tmp_path = f"{dest_path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    try:
+        os.link(src_path, tmp_path)
+    except OSError:
+        shutil.copyfile(src_path, tmp_path)
+    os.replace(tmp_path, dest_path)
+
+
+class BlobCache:
+    """
+    Content-addressed file store with size-bounded LRU eviction.
+    Entries are files named by key; recency is tracked through their mtime.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 2 * 1024 ** 3, suffix: str = ""):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}{self.suffix}")
+
+    def fetch(self, key: str, dest_path: str) -> bool:
+        """
+        Materializes the entry for key at dest_path. Returns False on a miss.
+        """
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+            link_or_copy(path, dest_path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def touch(self, key: str) -> bool:
+        """
+        Marks the entry for key as recently used. Returns False on a miss.
+        """
+        try:
+            os.utime(self.path_for(key))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def store(self, key: str, src_path: str):
+        link_or_copy(src_path, self.path_for(key))
+        self.trim()
+
+    def store_json(self, key: str, data: Any):
+        save_json_atomic(self.path_for(key), data)
+        self.trim()
+
+    def store_bytes(self, key: str, data: bytes):
+        save_bytes_atomic(self.path_for(key), data)
+        self.trim()
+
+    def trim(self, keep: Iterable[str] = ()):
+        """
+        Evicts least recently used files until the directory fits in max_bytes. Files whose
+        name starts with a key in `keep` (the entry and any temp files beside it) are never evicted.
+        """
+        keep = tuple(keep)
+        with self.lock:
+            entries, total = [], 0
+            for name in os.listdir(self.cache_dir):
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                total += stat.st_size
+                if not (keep and name.startswith(keep)):
+                    entries.append((stat.st_mtime_ns, stat.st_size, name))
+
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
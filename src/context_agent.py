@@ -1,26 +1,65 @@
 import os
+import re
+import time
+from typing import Optional
 from tavily import TavilyClient
 import dotenv
+from cache import BlobCache, text_sha256, load_json
+from instrumentation import tracer
 
 dotenv.load_dotenv()
 
+# Search results go stale slowly; an empty result is retried sooner
+CONTEXT_TTL = 7 * 24 * 3600
+EMPTY_CONTEXT_TTL = 24 * 3600
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
 class ContextAgent:
-    def __init__(self):
+    def __init__(self, client: Optional[TavilyClient] = None, cache_dir: Optional[str] = "data/cache/context",
+                 cache_max_bytes: int = 16 * 1024 ** 2, ttl: float = CONTEXT_TTL,
+                 empty_ttl: float = EMPTY_CONTEXT_TTL):
+        # Lookups keyed by (normalized query, search parameters); cache_dir=None disables it
+        self.cache = BlobCache(cache_dir, max_bytes=cache_max_bytes, suffix=".json") if cache_dir else None
+        self.ttl = ttl
+        self.empty_ttl = empty_ttl
         self.api_key = os.getenv("TAVILY_API_KEY")
-        if not self.api_key:
+        if client is not None:
+            self.client = client
+        elif not self.api_key:
             print("Warning: TAVILY_API_KEY not found. Context features will be disabled.")
             self.client = None
         else:
             self.client = TavilyClient(api_key=self.api_key)
 
-    def get_context(self, query: str) -> str:
+    def get_context(self, query: str, search_depth: str = "basic", max_results: int = 3,
+                    topic: str = "general") -> str:
         """
         Searches for the manga chapter summary/context.
         Returns a string summarizing the search results.
+
+        Results, including empty ones, are cached on disk for `ttl` (`empty_ttl` if empty);
+        failed searches are not cached.
         """
         if not self.client:
             return ""
 
+        started = time.time()
+        key = text_sha256(normalize_query(query), search_depth, max_results, topic)
+        if self.cache:
+            entry = load_json(self.cache.path_for(key))
+            if entry is not None:
+                ttl = self.ttl if entry["context"] else self.empty_ttl
+                if time.time() - entry["created_at"] < ttl:
+                    # Eviction is least recently used, so a hit counts as use
+                    self.cache.touch(key)
+                    print(f"Context cache hit for: '{query}'")
+                    tracer.record("context.search", started, cache_hit=True, bytes_out=len(entry["context"]))
+                    return entry["context"]
+
         print(f"Fetching context for: '{query}'...")
         try:
             # We use "advanced" depth for better RAG context if needed, 
@@ -28,10 +67,10 @@ class ContextAgent:
             # Including answer=True often gives a direct summary.
             response = self.client.search(
                 query=query,
-                search_depth="basic",
+                search_depth=search_depth,
                 include_answer=True,
-                max_results=3,
-                topic="general"
+                max_results=max_results,
+                topic=topic
             )
             
             context_parts = []
@@ -48,10 +87,16 @@ class ContextAgent:
                 context_parts.append(f"- {title}: {content}")
                 
             full_context = "\n\n".join(context_parts)
+            if not response.get("answer") and not response.get("results"):
+                full_context = ""
+            if self.cache:
+                self.cache.store_json(key, {"query": query, "created_at": time.time(), "context": full_context})
+            tracer.record("context.search", started, cache_hit=False, bytes_out=len(full_context))
             return full_context
 
         except Exception as e:
             print(f"Error fetching context: {e}")
+            tracer.record("context.search", started, cache_hit=False, error=type(e).__name__)
             return ""
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+"""
+Offline stand-ins for the Gemini and Tavily clients, for benchmarks and tests without API keys.
+Pass them as `client=` to VisionAgent, AudioGenerator and ContextAgent. Responses are
+deterministic; latency and 429 errors can be injected to exercise pacing and retries.
+"""
+import re
+import json
+import time
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List
+import numpy as np
+from google.genai import types
+
+FAKE_SAMPLE_RATE = 24000
+MOODS = ["Action", "Suspense", "Sad", "Happy", "Neutral"]
+
+
+class FakeAPIError(Exception):
+    pass
+
+
+class FakeBackend:
+    """
+    Shared behaviour: `latency` seconds before each response, `chunk_latency` between
+    streamed chunks, and every `rate_limit_every`-th request failing with a 429.
+    """
+
+    def __init__(self, latency: float = 0.0, chunk_latency: float = 0.0, rate_limit_every: int = 0):
+        self.latency = latency
+        self.chunk_latency = chunk_latency
+        self.rate_limit_every = rate_limit_every
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    def _request(self, kind: str):
+        with self.lock:
+            self.calls[kind] += 1
+            self.calls["total"] += 1
+            throttled = self.rate_limit_every and self.calls["total"] % self.rate_limit_every == 0
+            if throttled:
+                self.calls["throttled"] += 1
+        if throttled:
+            raise FakeAPIError("429 RESOURCE_EXHAUSTED (injected by fake backend)")
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _pause(self):
+        if self.chunk_latency:
+            time.sleep(self.chunk_latency)
+
+
+class FakeGemini(FakeBackend):
+    """
+    Stand-in for genai.Client covering files.upload/get, models.generate_content and
+    models.generate_content_stream. Analysis returns one segment per `pages_per_segment`
+    pages of a `page_count`-page document; TTS streams a sine tone as 16-bit PCM lasting
+    `seconds_per_word` per word of the script.
+    """
+
+    def __init__(self, page_count: int = 20, pages_per_segment: int = 3, words_per_script: int = 40,
+                 seconds_per_word: float = 0.35, **kwargs):
+        super().__init__(**kwargs)
+        self.page_count = page_count
+        self.pages_per_segment = pages_per_segment
+        self.words_per_script = words_per_script
+        self.seconds_per_word = seconds_per_word
+        self.files = _FakeFiles(self)
+        self.models = _FakeModels(self)
+
+    def segments(self, first_page: int, last_page: int) -> List[dict]:
+        segments = []
+        for start in range(first_page, last_page + 1, self.pages_per_segment):
+            end = min(last_page, start + self.pages_per_segment - 1)
+            words = " ".join(f"w{start}_{i}" for i in range(self.words_per_script - 4))
+            segments.append({
+                "start_page": start,
+                "end_page": end,
+                "script": f"Pages {start} to {end}: {words}",
+                "mood": MOODS[(start // self.pages_per_segment) % len(MOODS)],
+                "style_instructions": "Calm narrator voice."
+            })
+        return segments
+
+    def pcm(self, script: str) -> bytes:
+        seconds = max(1.0, len(script.split()) * self.seconds_per_word)
+        t = np.arange(int(seconds * FAKE_SAMPLE_RATE)) / FAKE_SAMPLE_RATE
+        return (8000 * np.sin(2 * np.pi * 220 * t)).astype("<i2").tobytes()
+
+    def respond(self, model: str, contents, config) -> Iterator[types.GenerateContentResponse]:
+        prompt = _prompt_text(contents)
+        if "tts" in model:
+            text = prompt.split("TEXT TO SPEAK:", 1)[-1].strip()
+            pcm = self.pcm(text)
+            step = FAKE_SAMPLE_RATE  # half a second of 16-bit audio per chunk
+            for i in range(0, len(pcm), step):
+                yield _response(types.Part(inline_data=types.Blob(
+                    data=pcm[i:i + step], mime_type=f"audio/L16;codec=pcm;rate={FAKE_SAMPLE_RATE}")))
+            return
+
+        pages = re.search(r"pages (\d+) to (\d+)", prompt)
+        first, last = (int(pages.group(1)), int(pages.group(2))) if pages else (1, self.page_count)
+        if config is not None and config.response_mime_type == "text/plain":
+            yield _response(types.Part(text=f"Summary of pages {first} to {last}."))
+            return
+
+        text = json.dumps(self.segments(first, last), ensure_ascii=False, indent=2)
+        for i in range(0, len(text), 256):
+            yield _response(types.Part(text=text[i:i + 256]))
+
+
+class _FakeFiles:
+    def __init__(self, backend: FakeGemini):
+        self.backend = backend
+        self.uploaded = {}
+
+    def upload(self, file, **kwargs) -> types.File:
+        self.backend._request("upload")
+        name = f"files/fake-{len(self.uploaded) + 1}"
+        self.uploaded[name] = types.File(
+            name=name,
+            uri=f"https://fake.invalid/{name}",
+            mime_type="application/pdf",
+            state=types.FileState.ACTIVE,
+            expiration_time=datetime.now(timezone.utc) + timedelta(hours=48),
+        )
+        return self.uploaded[name]
+
+    def get(self, name: str, **kwargs) -> types.File:
+        self.backend._request("files.get")
+        if name not in self.uploaded:
+            raise FakeAPIError(f"404 NOT_FOUND: {name}")
+        return self.uploaded[name]
+
+
+class _FakeModels:
+    def __init__(self, backend: FakeGemini):
+        self.backend = backend
+
+    def generate_content(self, model: str, contents, config=None, **kwargs) -> types.GenerateContentResponse:
+        self.backend._request("generate_content")
+        chunks = list(self.backend.respond(model, contents, config))
+        parts = [part for chunk in chunks for part in chunk.candidates[0].content.parts]
+        if parts and parts[0].text is not None:
+            parts = [types.Part(text="".join(part.text for part in parts))]
+        return _response(*parts)
+
+    def generate_content_stream(self, model: str, contents, config=None, **kwargs):
+        self.backend._request("generate_content_stream")
+        for chunk in self.backend.respond(model, contents, config):
+            yield chunk
+            self.backend._pause()
+
+
+class FakeTavily(FakeBackend):
+    """
+    Stand-in for TavilyClient.search with a fixed answer and `max_results` results.
+    """
+
+    def search(self, query: str, search_depth: str = "basic", include_answer: bool = False,
+               max_results: int = 5, topic: str = "general", **kwargs) -> dict:
+        self._request("search")
+        return {
+            "query": query,
+            "answer": f"Offline summary for '{query}'." if include_answer else None,
+            "results": [
+                {"title": f"Result {i + 1} for {query}", "url": f"https://fake.invalid/{i + 1}",
+                 "content": f"Offline content {i + 1} about {query}."}
+                for i in range(max_results)
+            ],
+        }
+
+
+def _prompt_text(contents) -> str:
+    if isinstance(contents, str):
+        return contents
+    texts = []
+    for content in contents if isinstance(contents, list) else [contents]:
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in getattr(content, "parts", None) or []:
+            if part.text:
+                texts.append(part.text)
+    return "\n".join(texts)
+
+
+def _response(*parts: types.Part) -> types.GenerateContentResponse:
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=list(parts)))])
@@ -0,0 +1,211 @@
+import io
+import os
+import math
+import bisect
+import numpy as np
+from PIL import Image, ImageFilter
+from typing import List, Optional, Tuple
+from cache import BlobCache, file_sha256, text_sha256
+import layout
+
+# Look of the cinematic clip: blurred and darkened background, figure-8 ("infinity") foreground drift
+BACKGROUND_OPACITY = 0.3
+BACKGROUND_BLUR = 0.02  # Gaussian radius, as a fraction of the screen height
+INFINITY_AMPLITUDE = (80, 40)  # pixels, (x, y)
+# The blur runs on a copy downscaled so that its radius is about this many pixels
+BLUR_WORKING_RADIUS = 4
+
+
+def infinity_offset(t: float, duration: float, amplitude: Tuple[float, float] = INFINITY_AMPLITUDE) -> Tuple[float, float]:
+    """
+    (dx, dy) displacement along a Lissajous figure-8, one full loop per `duration`.
+    """
+    u = (2 * math.pi * t) / duration
+    return amplitude[0] * math.sin(u), amplitude[1] * math.sin(2 * u)
+
+
+def blur_background(background: np.ndarray, radius: float, opacity: float = BACKGROUND_OPACITY) -> np.ndarray:
+    """
+    Gaussian-blurred, darkened copy of an RGB uint8 background. The blur is computed on a
+    downscaled copy (a small kernel there does the work of a large one at full size), then
+    scaled back up, which is indistinguishable once blurred.
+    """
+    h, w = background.shape[:2]
+    img = Image.fromarray(background)
+    if radius > 0:
+        factor = max(1, int(radius / BLUR_WORKING_RADIUS))
+        small = img.reduce(factor) if factor > 1 else img
+        small = small.filter(ImageFilter.GaussianBlur(radius / factor))
+        img = small.resize((w, h), Image.Resampling.BILINEAR) if factor > 1 else small
+    # Same 8-bit alpha MoviePy derives from with_opacity(), blended over the black base
+    alpha = int(opacity * 255)
+    return ((np.asarray(img).astype(np.uint16) * alpha + 127) // 255).astype(np.uint8)
+
+
+class CinematicRenderer:
+    """
+    Frame-level renderer for one page's cinematic clip.
+
+    The blurred, darkened background and the resized foreground are computed once as uint8
+    arrays; each frame is then a copy of the background with the foreground blitted at the
+    integer offset of the figure-8 path, written into a reused output buffer.
+
+    With a background_cache, finished backgrounds are stored as PNG keyed by the page's
+    content hash and the look parameters, so re-renders skip the resize and blur.
+
+    Note: frame_at() returns the same buffer on every call; copy it to keep a frame.
+    """
+
+    def __init__(self, image_path: str, duration: float, screen_size: Tuple[int, int] = layout.DEFAULT_SCREEN_SIZE,
+                 background_opacity: float = BACKGROUND_OPACITY, amplitude: Tuple[float, float] = INFINITY_AMPLITUDE,
+                 draft: bool = False, background_blur: float = BACKGROUND_BLUR,
+                 background_cache: Optional[BlobCache] = None):
+        self.duration = duration
+        self.screen_size = tuple(screen_size)
+        self.amplitude = amplitude
+        # Draft quality: JPEG pages are decoded at a reduced scale and resized bilinearly
+        self.draft = draft
+
+        key = None
+        self.background = None
+        if background_cache:
+            key = text_sha256(file_sha256(image_path), self.screen_size, background_opacity, background_blur, draft)
+            self.background = self._load_cached(background_cache, key)
+
+        background, self.foreground = self._load_layers(image_path, with_background=self.background is None)
+        if self.background is None:
+            self.background = blur_background(background, background_blur * self.screen_size[1], background_opacity)
+            if background_cache:
+                buffer = io.BytesIO()
+                Image.fromarray(self.background).save(buffer, "PNG", compress_level=1)
+                background_cache.store_bytes(key, buffer.getvalue())
+        self.frame = np.empty_like(self.background)
+
+        screen_w, screen_h = self.screen_size
+        fg_h, fg_w = self.foreground.shape[:2]
+        self.origin = (screen_w / 2 - fg_w / 2, screen_h / 2 - fg_h / 2)
+
+    def _load_cached(self, cache: BlobCache, key: str) -> Optional[np.ndarray]:
+        path = cache.path_for(key)
+        try:
+            os.utime(path)
+            with Image.open(path) as img:
+                background = np.asarray(img.convert("RGB"))
+        except (OSError, ValueError):
+            return None
+        # A layer from another screen size would misalign every frame
+        if background.shape[:2] != (self.screen_size[1], self.screen_size[0]):
+            return None
+        return background
+
+    def _load_layers(self, image_path: str, with_background: bool = True) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """
+        Returns (background, foreground) as RGB uint8 arrays, using the pre-scaled
+        variants from PDFProcessor when present. The background is None unless with_background.
+        """
+        bg_variant = layout.variant_path(image_path, "bg", self.screen_size)
+        fg_variant = layout.variant_path(image_path, "fg", self.screen_size)
+        if os.path.exists(bg_variant) and os.path.exists(fg_variant):
+            with Image.open(fg_variant) as fg:
+                foreground = np.asarray(fg.convert("RGB"))
+            if not with_background:
+                return None, foreground
+            with Image.open(bg_variant) as bg:
+                return np.asarray(bg.convert("RGB")), foreground
+
+        with Image.open(image_path) as img:
+            # Layer sizes follow the original page size, even when draft() decodes it smaller
+            bg_size = layout.background_size(img.size, self.screen_size)
+            fg_size = layout.foreground_size(img.size, self.screen_size)
+            resample = Image.Resampling.LANCZOS
+            if self.draft:
+                img.draft("RGB", fg_size)
+                resample = Image.Resampling.BILINEAR
+            img = img.convert("RGB")
+            fg = np.asarray(img.resize(fg_size, resample))
+            if not with_background:
+                return None, fg
+            bg = img.resize(bg_size, resample).crop(layout.background_crop_box(bg_size, self.screen_size))
+            return np.asarray(bg), fg
+
+    def position_at(self, t: float) -> Tuple[int, int]:
+        dx, dy = infinity_offset(t, self.duration, self.amplitude)
+        # int() truncation, as MoviePy does for clip positions
+        return int(self.origin[0] + dx), int(self.origin[1] + dy)
+
+    def frame_at(self, t: float) -> np.ndarray:
+        x, y = self.position_at(t)
+        screen_w, screen_h = self.screen_size
+        fg_h, fg_w = self.foreground.shape[:2]
+
+        # Clip the foreground rectangle against the screen
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + fg_w, screen_w), min(y + fg_h, screen_h)
+
+        np.copyto(self.frame, self.background)
+        if x1 > x0 and y1 > y0:
+            self.frame[y0:y1, x0:x1] = self.foreground[y0 - y:y1 - y, x0 - x:x1 - x]
+        return self.frame
+
+
+class PageSequence:
+    """
+    Frame source for a run of pages played back to back, each (image_path, duration) with a
+    fade-in from black. Only the current page's CinematicRenderer is alive: it is built when
+    playback reaches the page and released when the next one starts, so memory stays flat
+    however many pages the video has. Frames are expected in increasing time order, as an
+    encoder requests them; seeking back rebuilds the page. Like CinematicRenderer.frame_at(),
+    frame_at() returns reused buffers.
+
+    The fade matches MoviePy's FadeIn followed by its uint8 conversion.
+    """
+
+    def __init__(self, pages: List[Tuple[str, float]], screen_size: Tuple[int, int] = layout.DEFAULT_SCREEN_SIZE,
+                 fade_in: float = 0.0, amplitude: Tuple[float, float] = INFINITY_AMPLITUDE, draft: bool = False,
+                 background_cache: Optional[BlobCache] = None):
+        self.pages = pages
+        self.screen_size = tuple(screen_size)
+        self.fade_in = fade_in
+        self.amplitude = amplitude
+        self.draft = draft
+        self.background_cache = background_cache
+        self.starts = []
+        self.duration = 0.0
+        for _, duration in pages:
+            self.starts.append(self.duration)
+            self.duration += duration
+        self.index: Optional[int] = None
+        self.renderer: Optional[CinematicRenderer] = None
+        self.faded: Optional[np.ndarray] = None
+        self.pages_built = 0
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+    def _renderer_for(self, index: int) -> CinematicRenderer:
+        if index != self.index:
+            # Drop the previous page's layers before loading the next
+            self.renderer = None
+            image_path, duration = self.pages[index]
+            self.renderer = CinematicRenderer(image_path, duration, self.screen_size, amplitude=self.amplitude,
+                                              draft=self.draft, background_cache=self.background_cache)
+            self.index = index
+            self.pages_built += 1
+        return self.renderer
+
+    def frame_at(self, t: float) -> np.ndarray:
+        index = min(max(bisect.bisect_right(self.starts, t) - 1, 0), len(self.pages) - 1)
+        local_t = t - self.starts[index]
+        frame = self._renderer_for(index).frame_at(local_t)
+        if local_t < self.fade_in:
+            if self.faded is None or self.faded.shape != frame.shape:
+                self.faded = np.empty_like(frame)
+            # Float product truncated to uint8, written into a reused buffer
+            np.multiply(frame, local_t / self.fade_in, out=self.faded, casting="unsafe")
+            return self.faded
+        return frame
+
+    def close(self):
+        self.renderer = None
+        self.faded = None
+        self.index = None
@@ -0,0 +1,187 @@
+import os
+import time
+import functools
+import resource
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from cache import save_json_atomic
+
+
+def process_usage() -> dict:
+    """
+    CPU seconds and high-water resident memory (MiB) of this process and of its finished
+    children. Pool workers are started by the forkserver, not by this process, so they never
+    count as its children: they send their own usage back (see Tracer.add_worker_usage).
+    """
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # ru_maxrss is in KiB on Linux
+    return {"cpu_s": own.ru_utime + own.ru_stime, "children_cpu_s": children.ru_utime + children.ru_stime,
+            "maxrss_mb": own.ru_maxrss / 1024, "children_maxrss_mb": children.ru_maxrss / 1024}
+
+
+def peak_rss_mb(workers: Optional[dict] = None) -> dict:
+    """
+    High-water resident memory of this process, of its finished children and, when given
+    (Tracer.workers_usage()), of the pool workers and their children, in MiB.
+    """
+    usage = process_usage()
+    peaks = {"self": round(usage["maxrss_mb"], 1), "children": round(usage["children_maxrss_mb"], 1)}
+    if workers:
+        peaks.update(workers=round(workers["maxrss_mb"], 1), worker_children=round(workers["children_maxrss_mb"], 1))
+    return peaks
+
+
+class Span:
+    """
+    One timed operation. Attributes describe it (bytes_in, bytes_out, retries, sleep_s,
+    frames, ...); numeric ones are summed per span name in the run report.
+    """
+
+    __slots__ = ("name", "start", "end", "pid", "tid", "thread", "attrs")
+
+    def __init__(self, name: str, attrs: dict, start: Optional[float] = None):
+        self.name = name
+        self.start = time.time() if start is None else start
+        self.end = None
+        self.pid = os.getpid()
+        self.tid = threading.get_ident()
+        self.thread = threading.current_thread().name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def add(self, key: str, value: float = 1):
+        self.attrs[key] = self.attrs.get(key, 0) + value
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "start": self.start, "end": self.end,
+                "duration": round(self.end - self.start, 6), "pid": self.pid, "tid": self.tid,
+                "thread": self.thread, "attrs": self.attrs}
+
+
+class Tracer:
+    """
+    Collects finished spans from every thread of the process. Worker processes return
+    their spans (drain()) and resource usage (process_usage()), and the parent merges them with
+    extend() and add_worker_usage(). Timestamps are wall-clock seconds, so spans from different
+    processes line up.
+    """
+
+    def __init__(self):
+        self.spans: List[dict] = []
+        # Worker pid -> its latest process_usage(), cumulative over the worker's life
+        self.workers: Dict[int, dict] = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attrs) -> Iterator[Span]:
+        span = Span(name, attrs)
+        try:
+            yield span
+        except Exception as e:
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            span.end = time.time()
+            with self.lock:
+                self.spans.append(span.to_dict())
+
+    def record(self, name: str, start: float, **attrs):
+        """
+        Adds a span that has already ended, for code that can't wrap itself in span().
+        """
+        span = Span(name, attrs, start=start)
+        span.end = time.time()
+        with self.lock:
+            self.spans.append(span.to_dict())
+
+    def extend(self, spans: List[dict]):
+        with self.lock:
+            self.spans.extend(spans)
+
+    def add_worker_usage(self, pid: int, usage: dict):
+        with self.lock:
+            self.workers[pid] = usage
+
+    def workers_usage(self) -> dict:
+        """
+        Totals over every pool worker seen so far: CPU seconds including the workers' own
+        children (e.g. ffmpeg), and the highest peak memory of a worker and of a child.
+        """
+        with self.lock:
+            usages = list(self.workers.values())
+        return {"cpu_s": sum(u["cpu_s"] + u["children_cpu_s"] for u in usages),
+                "maxrss_mb": max((u["maxrss_mb"] for u in usages), default=0.0),
+                "children_maxrss_mb": max((u["children_maxrss_mb"] for u in usages), default=0.0)}
+
+    def drain(self) -> List[dict]:
+        with self.lock:
+            spans, self.spans = self.spans, []
+        return spans
+
+    def snapshot(self, since: float = 0) -> List[dict]:
+        with self.lock:
+            return sorted((s for s in self.spans if s["start"] >= since), key=lambda s: s["start"])
+
+    def report(self, since: float = 0, **meta) -> dict:
+        """
+        Run report: per-name totals (count, seconds, summed numeric attributes),
+        peak memory and the raw spans.
+        """
+        spans = self.snapshot(since)
+        summary = {}
+        for s in spans:
+            entry = summary.setdefault(s["name"], {"count": 0, "total_s": 0.0, "max_s": 0.0})
+            entry["count"] += 1
+            entry["total_s"] = round(entry["total_s"] + s["duration"], 6)
+            entry["max_s"] = max(entry["max_s"], s["duration"])
+            for key, value in s["attrs"].items():
+                if isinstance(value, (int, float)):
+                    entry[key] = round(entry.get(key, 0) + value, 6)
+        workers = self.workers_usage() if self.workers else None
+        return dict(meta, peak_rss_mb=peak_rss_mb(workers), summary=summary, spans=spans)
+
+    def write_report(self, path: str, since: float = 0, **meta):
+        save_json_atomic(path, self.report(since, **meta))
+        print(f"Run report written to: {path}")
+
+    def write_chrome_trace(self, path: str, since: float = 0):
+        """
+        Writes the spans in Chrome trace format (chrome://tracing, Perfetto).
+        """
+        spans = self.snapshot(since)
+        origin = spans[0]["start"] if spans else 0
+        events = []
+        threads = {}
+        for s in spans:
+            threads[(s["pid"], s["tid"])] = s["thread"]
+            events.append({
+                "name": s["name"], "cat": s["name"].split(".")[0], "ph": "X",
+                "ts": round((s["start"] - origin) * 1e6), "dur": round(s["duration"] * 1e6),
+                "pid": s["pid"], "tid": s["tid"], "args": s["attrs"],
+            })
+        for (pid, tid), thread in threads.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread}})
+        save_json_atomic(path, {"traceEvents": events, "displayTimeUnit": "ms"})
+        print(f"Chrome trace written to: {path}")
+
+
+# Process-wide tracer used by all pipeline components
+tracer = Tracer()
+span = tracer.span
+
+
+def traced(name: str):
+    """
+    Decorator recording each call of the function as a span.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,59 @@
+import json
+from typing import Any, List
+
+
+class JSONArrayStream:
+    """
+    Incremental parser for a streamed JSON array of objects, e.g. a model response arriving
+    in chunks. feed() returns the top-level objects completed by the new text, as soon as
+    their closing brace arrives; an object that does not parse is returned as None instead
+    of failing the whole array. Text around the array (such as Markdown fences) is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.start = None
+        # True once the top-level array's closing bracket has been seen
+        self.closed = False
+
+    def feed(self, text: str) -> List[Any]:
+        self.buffer += text
+        items = []
+        while self.pos < len(self.buffer) and not self.closed:
+            c = self.buffer[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif c == "\\":
+                    self.escape = True
+                elif c == '"':
+                    self.in_string = False
+            elif c == '"' and self.depth > 0:
+                self.in_string = True
+            elif c in "[{":
+                self.depth += 1
+                if self.depth == 2 and c == "{":
+                    self.start = self.pos
+            elif c in "]}" and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 1 and c == "}" and self.start is not None:
+                    try:
+                        items.append(json.loads(self.buffer[self.start:self.pos + 1]))
+                    except ValueError:
+                        items.append(None)
+                    self.start = None
+                elif self.depth == 0:
+                    self.closed = True
+            self.pos += 1
+
+        # Drop consumed text, keeping the object in progress
+        keep = self.start if self.start is not None else self.pos
+        self.buffer = self.buffer[keep:]
+        self.pos -= keep
+        if self.start is not None:
+            self.start = 0
+        return items
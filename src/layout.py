@@ -0,0 +1,54 @@
+import os
+import math
+from typing import Tuple
+
+# Geometry shared by extraction (pre-scaled variants) and the video editor, so both
+# stages agree on the exact pixel sizes of each layer.
+
+DEFAULT_SCREEN_SIZE = (1920, 1080)
+FOREGROUND_MARGIN = 1.10  # 10% margin for movement
+# Finished (blurred, darkened) background layers, see frame_renderer.CinematicRenderer
+BACKGROUND_CACHE_DIR = "data/cache/backgrounds"
+
+
+def foreground_size(img_size: Tuple[int, int], screen_size: Tuple[int, int]) -> Tuple[int, int]:
+    """Fit-to-screen size of the moving foreground, including the movement margin."""
+    img_w, img_h = img_size
+    screen_w, screen_h = screen_size
+    ratio_fg = min(screen_w / img_w, screen_h / img_h) * FOREGROUND_MARGIN
+    return int(img_w * ratio_fg), int(img_h * ratio_fg)
+
+
+def background_size(img_size: Tuple[int, int], screen_size: Tuple[int, int]) -> Tuple[int, int]:
+    """Cover-the-screen size of the background, before center cropping."""
+    img_w, img_h = img_size
+    screen_w, screen_h = screen_size
+    ratio_bg = max(screen_w / img_w, screen_h / img_h)
+    return int(img_w * ratio_bg), int(img_h * ratio_bg)
+
+
+def background_crop_box(bg_size: Tuple[int, int], screen_size: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    """(x1, y1, x2, y2) of the centered screen-sized window inside the resized background."""
+    bg_w, bg_h = bg_size
+    screen_w, screen_h = screen_size
+    x1 = int(bg_w / 2 - screen_w / 2)
+    y1 = int(bg_h / 2 - screen_h / 2)
+    return x1, y1, x1 + screen_w, y1 + screen_h
+
+
+def render_dpi(page_size_pts: Tuple[float, float], screen_size: Tuple[int, int]) -> int:
+    """
+    Smallest DPI at which a PDF page (in points) rasterizes at least as large as its
+    foreground layer, so the editor only ever downscales it.
+    """
+    scale = min(screen_size[0] / page_size_pts[0], screen_size[1] / page_size_pts[1]) * FOREGROUND_MARGIN
+    return max(1, math.ceil(scale * 72))
+
+
+def variant_path(image_path: str, kind: str, screen_size: Tuple[int, int]) -> str:
+    """
+    Path of a pre-scaled layer ("fg" or "bg") for a page image,
+    e.g. page_001.jpeg -> page_001_fg_1920x1080.jpeg
+    """
+    base, ext = os.path.splitext(image_path)
+    return f"{base}_{kind}_{screen_size[0]}x{screen_size[1]}{ext}"
@@ -1,131 +1,71 @@
 import os
-import json
-import time
-from pdf_processor import PDFProcessor
-from vision_agent import VisionAgent
-from audio_generator import AudioGenerator
-from video_editor import VideoEditor
-from context_agent import ContextAgent
+import sys
+import argparse
+from ffmpeg_tools import ENCODER_PROFILES, DEFAULT_ENCODER_PROFILE
 
-def main():
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Manga Recap Generator (Fully Automated)")
+    parser.add_argument("pdf_path", nargs="?", help="Path to the Manga PDF (prompted for if omitted)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip stages (and TTS segments) already completed for this PDF in a previous run")
+    parser.add_argument("--refresh-analysis", action="store_true",
+                        help="Ignore the cached vision analysis of this PDF and run it again")
+    parser.add_argument("--sequential-render", action="store_true",
+                        help="Encode the whole video in one pass instead of parallel segments")
+    parser.add_argument("--render-workers", type=int, default=None,
+                        help="Processes used for parallel segment rendering (default: CPU count)")
+    parser.add_argument("--tts-rpm", type=float, default=10,
+                        help="Maximum TTS requests per minute")
+    parser.add_argument("--encoder-profile", choices=sorted(ENCODER_PROFILES), default=DEFAULT_ENCODER_PROFILE,
+                        help="x264 settings for the video encode (see ffmpeg_tools.ENCODER_PROFILES)")
+    parser.add_argument("--preview", action="store_true",
+                        help="Render a low-resolution proxy (same timing and audio) instead of the final video")
+    parser.add_argument("--preview-segments", type=lambda s: [int(v) for v in s.split(",")], default=None,
+                        help="With --preview, only these segment numbers, e.g. 2,5 (as numbered in the log)")
+    parser.add_argument("--report", default=None,
+                        help="Run report with per-stage timings (default: output/reports/<pdf>.json)")
+    parser.add_argument("--trace", default=None,
+                        help="Also write a Chrome trace of the run (chrome://tracing, Perfetto) to this path")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
     print("=== Manga Recap Generator (Fully Automated) ===")
     
-    pdf_path = input("Enter the path to the Manga PDF: ").strip()
+    pdf_path = args.pdf_path or input("Enter the path to the Manga PDF: ").strip()
     if not os.path.exists(pdf_path):
         print(f"Error: File {pdf_path} not found.")
-        return
-
-    # 1. Extract Images
-    processor = PDFProcessor()
-    image_paths = processor.extract_images(pdf_path)
-    
-    # 2. Analyze PDF with Gemini (Full Context + Smart Web Context)
-    vision_agent = VisionAgent()
-    audio_gen = AudioGenerator()
-    context_agent = ContextAgent()
-    
-    # --- SMART CONTEXT FETCHING ---
-    context_text = ""
-    if context_agent.client:
-        # Derive query from filename (e.g. "chapetre-28.pdf" -> "chapetre-28 summary")
-        # Better: user should name file "Boruto_Chapter_28.pdf"
-        base_name = os.path.basename(pdf_path).replace(".pdf", "").replace("_", " ").replace("-", " ")
-        query = f"{base_name} manga chapter summary plot characters"
-        print(f"\n[Smart Context] Searching for: '{query}'...")
-        context_text = context_agent.get_context(query)
-        if context_text:
-            print(f"[Smart Context] Found external context ({len(context_text)} chars).")
-        else:
-            print("[Smart Context] No context found or API missing.")
-    
-    print("\nStarting AI Analysis of the PDF...")
-    try:
-        segments = vision_agent.analyze_pdf(pdf_path, story_context=context_text)
-    except Exception as e:
-        print(f"Critical Error during analysis: {e}")
-        return
-
-    print(f"\nAnalysis complete. Generated {len(segments)} narrative segments.")
+        return 1
 
-    # 3. Process Segments and Generate Audio
-    print("\nGenerating Audio Narration (Per Segment)...")
-    audio_dir = "data/audio"
-    os.makedirs(audio_dir, exist_ok=True)
-    
-    batches_data = []
-    
-    for i, seg in enumerate(segments):
-        start_page = seg.get('start_page', 1)
-        end_page = seg.get('end_page', 1)
-        script = seg.get('script', "")
-        style = seg.get('style_instructions', "")
-        mood = seg.get('mood', "Neutral")
-        
-        print(f"Processing Segment {i+1}: Pages {start_page}-{end_page} [{mood}]")
-        
-        # Identify corresponding images (1-based index to 0-based list)
-        # Ensure indices are within bounds
-        start_idx = max(0, start_page - 1)
-        end_idx = min(len(image_paths), end_page)
-        
-        segment_images = image_paths[start_idx:end_idx]
-        
-        if not segment_images:
-            print(f"Warning: No images found for pages {start_page}-{end_page}")
-            continue
-
-        audio_filename = f"segment_{i+1:03d}.wav"
-        audio_path = os.path.join(audio_dir, audio_filename)
-        
-        try:
-            audio_gen.generate_audio(
-                script_text=script,
-                style_text=style,
-                output_path=audio_path
-            )
-            
-            # Create batch item
-            # We store the segment script in the first item or just carrying it in the batch is enough
-            # But specific items structure is expected by VideoEditor to find images
-            batch_items = []
-            for img in segment_images:
-                batch_items.append({
-                    "image_path": img,
-                    "script": script # redundant but keeps structure
-                })
-            
-            batches_data.append({
-                "audio_path": audio_path,
-                "items": batch_items,
-                "segment_script": script,
-                "mood": mood
-            })
-            
-            # Higher delay for TTS API to respect quotas
-            time.sleep(5) 
-        except Exception as e:
-            print(f"Error generating audio for segment {i+1}: {e}")
-
-    # 5. Assemble Video
-    if not batches_data:
-        print("No audio generated, skipping video assembly.")
-        return
+    # Imported once the arguments are valid: stages load their own heavy dependencies
+    from pipeline import RecapPipeline
 
-    print("\nAssembling Final Video...")
-    editor = VideoEditor()
     pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
-    output_name = f"{pdf_name}_recap.mp4"
-    
-    final_path = editor.create_video(batches_data, output_filename=output_name)
+    pipeline = RecapPipeline(
+        pdf_path,
+        resume=args.resume,
+        refresh_analysis=args.refresh_analysis,
+        parallel_render=not args.sequential_render,
+        render_workers=args.render_workers,
+        tts_requests_per_minute=args.tts_rpm,
+        encoder_profile=args.encoder_profile,
+        preview=args.preview or bool(args.preview_segments),
+        preview_segments=args.preview_segments,
+        report_path=args.report or os.path.join("output", "reports", f"{pdf_name}.json"),
+        trace_path=args.trace,
+    )
+    try:
+        final_path = pipeline.run()
+    except Exception as e:
+        print(f"Critical Error: {e}")
+        print("Completed stages are saved; re-run with --resume to continue.")
+        return 1
     
-    if final_path:
+    if final_path and pipeline.preview:
+        print(f"\nPreview ready: {final_path}")
+    elif final_path:
         print(f"\nSUCCESS! Your Manga Recap is ready: {final_path}")
-
-    # Save project state for debugging/reuse
-    data_file = "config/recap_project.json"
-    recap_data = {"pdf_name": pdf_name, "batches": batches_data}
-    with open(data_file, "w") as f:
-        json.dump(recap_data, f, indent=4)
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -1,31 +1,201 @@
 import os
-from pdf2image import convert_from_path
-from typing import List
+import re
+import time
+from collections import deque
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import Image
+from typing import Dict, Iterator, List, Optional, Tuple
+from cache import file_sha256, load_json, save_json_atomic
+from instrumentation import tracer
+from workers import process_pool
+import layout
+
+
+def _page_sizes(pdf_path: str, first_page: int, last_page: int) -> Dict[int, Tuple[float, float]]:
+    """
+    Page sizes in points for first_page..last_page, as reported by pdfinfo.
+    """
+    info = pdfinfo_from_path(pdf_path, first_page=first_page, last_page=last_page)
+    sizes = {}
+    for key, value in info.items():
+        key_match = re.match(r"Page\s+(\d+) size", key)
+        value_match = re.match(r"([\d.]+) x ([\d.]+) pts", str(value))
+        if key_match and value_match:
+            sizes[int(key_match.group(1))] = (float(value_match.group(1)), float(value_match.group(2)))
+    if not sizes and "Page size" in info:
+        # Older pdfinfo only reports the first page; assume a uniform chapter
+        value_match = re.match(r"([\d.]+) x ([\d.]+) pts", str(info["Page size"]))
+        if value_match:
+            size = (float(value_match.group(1)), float(value_match.group(2)))
+            sizes = {n: size for n in range(first_page, last_page + 1)}
+    return sizes
+
+
+def _save_variants(page: Image.Image, image_path: str, fmt: str, quality: int,
+                   screen_size: Tuple[int, int]) -> Dict[str, str]:
+    """
+    Saves the foreground (fit x margin) and background (cover, center-cropped) layers
+    exactly at the sizes VideoEditor composites them, so it never resizes at render time.
+    """
+    fg_path = layout.variant_path(image_path, "fg", screen_size)
+    fg = page.resize(layout.foreground_size(page.size, screen_size), Image.Resampling.LANCZOS)
+    fg.save(fg_path, fmt.upper(), quality=quality)
+    fg.close()
+
+    bg_path = layout.variant_path(image_path, "bg", screen_size)
+    bg_size = layout.background_size(page.size, screen_size)
+    bg = page.resize(bg_size, Image.Resampling.LANCZOS).crop(layout.background_crop_box(bg_size, screen_size))
+    bg.save(bg_path, fmt.upper(), quality=quality)
+    bg.close()
+    return {"fg": fg_path, "bg": bg_path}
+
+
+def _render_page_range(pdf_path: str, first_page: int, last_page: int, dpi: int,
+                       fmt: str, quality: int, output_dir: str, pdf_name: str,
+                       screen_size: Optional[Tuple[int, int]] = None) -> List[Tuple[str, Dict[str, str]]]:
+    """
+    Worker: rasterizes pages first_page..last_page (1-based, inclusive) and saves them.
+    Only the paths travel back to the parent process, never the decoded pages.
+
+    With a screen_size, the range is rasterized at the DPI its largest page needs for
+    the video instead of `dpi`, and the pre-scaled layers are saved next to each page.
+    """
+    if screen_size:
+        sizes = _page_sizes(pdf_path, first_page, last_page)
+        if sizes:
+            dpi = max(layout.render_dpi(size, screen_size) for size in sizes.values())
+
+    pages = convert_from_path(pdf_path, dpi=dpi, first_page=first_page, last_page=last_page)
+    results = []
+    for offset, page in enumerate(pages):
+        image_name = f"{pdf_name}_page_{first_page + offset:03d}.{fmt}"
+        image_path = os.path.join(output_dir, image_name)
+        page.save(image_path, fmt.upper(), quality=quality)
+        variants = _save_variants(page, image_path, fmt, quality, screen_size) if screen_size else {}
+        page.close()
+        results.append((image_path, variants))
+    return results
+
 
 class PDFProcessor:
-    def __init__(self, output_dir: str = "data/images"):
+    def __init__(self, output_dir: str = "data/images", workers: Optional[int] = None, pages_per_task: int = 4):
         self.output_dir = output_dir
+        self.manifest_dir = os.path.join(output_dir, ".manifests")
+        self.workers = workers or os.cpu_count() or 1
+        self.pages_per_task = max(1, pages_per_task)
         os.makedirs(self.output_dir, exist_ok=True)
 
-    def extract_images(self, pdf_path: str, fmt: str = "jpeg") -> List[str]:
+    def extract_images(self, pdf_path: str, fmt: str = "jpeg", dpi: int = 200, quality: int = 75,
+                       screen_size: Optional[Tuple[int, int]] = None) -> List[str]:
         """
         Converts PDF pages to images and saves them.
         Returns a list of paths to the generated images.
+
+        If screen_size is given, pages are rendered at the resolution the video needs
+        (dpi is ignored) and pre-scaled fg/bg layers are written alongside (see layout.variant_path).
+        """
+        return list(self.iter_images(pdf_path, fmt=fmt, dpi=dpi, quality=quality, screen_size=screen_size))
+
+    def iter_images(self, pdf_path: str, fmt: str = "jpeg", dpi: int = 200, quality: int = 75,
+                    screen_size: Optional[Tuple[int, int]] = None) -> Iterator[str]:
+        """
+        Streaming variant of extract_images: page ranges are rasterized across a
+        process pool and each path is yielded (in page order) as soon as its range is saved.
+        At most `workers * 2` ranges are in flight, which bounds the decoded pages held at once.
+
+        Pages already rendered from the same PDF content with the same settings are
+        served from the page manifest without touching the PDF.
         """
-        print(f"Converting PDF: {pdf_path}...")
-        pages = convert_from_path(pdf_path)
-        image_paths = []
-        
+        started = time.time()
+        pdf_hash = file_sha256(pdf_path)
+        manifest_path = os.path.join(self.manifest_dir, f"{pdf_hash}.json")
+        manifest = load_json(manifest_path, default={})
+        settings = {"dpi": dpi, "fmt": fmt, "quality": quality}
+        if screen_size:
+            settings = {"screen_size": list(screen_size), "fmt": fmt, "quality": quality}
+
+        page_count = manifest.get("page_count")
+        if page_count is None:
+            page_count = pdfinfo_from_path(pdf_path)["Pages"]
+        pages = {int(k): v for k, v in manifest.get("pages", {}).items()}
         pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
-        
-        for i, page in enumerate(pages):
-            image_name = f"{pdf_name}_page_{i+1:03d}.{fmt}"
-            image_path = os.path.join(self.output_dir, image_name)
-            page.save(image_path, fmt.upper())
-            image_paths.append(image_path)
-            print(f"Saved: {image_path}")
-            
-        return image_paths
+
+        stale = {n for n in range(1, page_count + 1) if not self._is_cached(pages.get(n), settings)}
+        if not stale:
+            print(f"Page cache hit: {page_count} pages of {pdf_path}")
+            tracer.record("pdf.extract", started, pdf=pdf_path, pages=page_count, pages_rendered=0)
+            for n in range(1, page_count + 1):
+                yield pages[n]["path"]
+            return
+
+        print(f"Converting PDF: {pdf_path} ({len(stale)}/{page_count} pages to render)...")
+
+        # Page-ordered plan: cached pages pass straight through, stale runs become render tasks
+        plan = deque()
+        n = 1
+        while n <= page_count:
+            if n not in stale:
+                plan.append(("cached", n, n))
+                n += 1
+                continue
+            last = n
+            while last + 1 <= page_count and last + 1 in stale and last - n + 1 < self.pages_per_task:
+                last += 1
+            plan.append(("render", n, last))
+            n = last + 1
+
+        max_in_flight = self.workers * 2
+        try:
+            with process_pool(self.workers) as pool:
+                pending = deque()
+                while plan or pending:
+                    while plan and len(pending) < max_in_flight:
+                        kind, first, last = plan.popleft()
+                        if kind == "cached":
+                            pending.append((first, None))
+                        else:
+                            pending.append((first, pool.submit(
+                                _render_page_range, pdf_path, first, last, dpi, fmt, quality,
+                                self.output_dir, pdf_name, screen_size
+                            )))
+                    # Results are consumed in plan order, so paths stay in page order
+                    first, future = pending.popleft()
+                    if future is None:
+                        yield pages[first]["path"]
+                        continue
+                    for offset, (image_path, variants) in enumerate(future.result()):
+                        pages[first + offset] = self._manifest_entry(image_path, settings, variants)
+                        print(f"Saved: {image_path}")
+                        yield image_path
+        finally:
+            save_json_atomic(manifest_path, {
+                "pdf_path": pdf_path,
+                "page_count": page_count,
+                "pages": {str(k): v for k, v in sorted(pages.items())},
+            })
+            rendered = [pages[n] for n in stale if n in pages and self._is_cached(pages[n], settings)]
+            tracer.record("pdf.extract", started, pdf=pdf_path, pages=page_count, pages_rendered=len(rendered),
+                          bytes_in=os.path.getsize(pdf_path), bytes_out=sum(p["size"] for p in rendered))
+
+    def _manifest_entry(self, image_path: str, settings: dict, variants: Dict[str, str]) -> dict:
+        stat = os.stat(image_path)
+        return {"path": image_path, "settings": settings, "variants": variants,
+                "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def _is_cached(self, entry: Optional[dict], settings: dict) -> bool:
+        """
+        A page is reusable only if it was rendered with the same settings and the file on
+        disk is still the one we wrote (another PDF with the same name may have overwritten it).
+        """
+        if not entry or entry.get("settings") != settings:
+            return False
+        if not all(os.path.exists(p) for p in entry.get("variants", {}).values()):
+            return False
+        try:
+            stat = os.stat(entry["path"])
+        except OSError:
+            return False
+        return stat.st_size == entry.get("size") and stat.st_mtime_ns == entry.get("mtime_ns")
 
 if __name__ == "__main__":
     # Test block (requires a sample.pdf)
@@ -0,0 +1,492 @@
+import os
+import json
+import time
+import queue
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional
+from ffmpeg_tools import DEFAULT_ENCODER_PROFILE
+from cache import file_sha256, text_sha256, load_json, save_json_atomic
+from wav_writer import is_complete_wav
+from instrumentation import span, traced, tracer
+import layout
+
+# The agents and the editor pull in google-genai, tavily, pdf2image, numpy and PIL. They are
+# imported by the stages that use them, so --help, resumed runs and cache hits start fast.
+if TYPE_CHECKING:
+    from pdf_processor import PDFProcessor
+    from vision_agent import VisionAgent
+    from audio_generator import AudioGenerator
+    from context_agent import ContextAgent
+
+
+class RunManifest:
+    """
+    Persisted state of one pipeline run: for every stage, its status, a hash of its
+    inputs and its outputs. Saved after every change, so a crash loses at most the
+    work in flight.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.data = load_json(path, default={})
+        self.data.setdefault("stages", {})
+        self.lock = threading.Lock()
+
+    def get(self, stage: str) -> Optional[dict]:
+        return self.data["stages"].get(stage)
+
+    def update(self, stage: str, **fields):
+        with self.lock:
+            record = self.data["stages"].setdefault(stage, {})
+            record.update(fields)
+            record["updated_at"] = datetime.now(timezone.utc).isoformat()
+            save_json_atomic(self.path, self.data)
+
+    def is_done(self, stage: str, inputs: str) -> bool:
+        record = self.get(stage)
+        return bool(record) and record.get("status") == "done" and record.get("inputs") == inputs
+
+
+class RecapPipeline:
+    """
+    Stage-based runner for one chapter: extract (with the context lookup and PDF upload running
+    alongside) -> analyze -> tts -> render (or a quick preview render with preview=True).
+    With parallel rendering, tts and render overlap: each segment is queued for rendering
+    as soon as its narration is ready.
+
+    Each stage records its input hash and outputs in a RunManifest. With resume=True, a stage
+    whose inputs are unchanged is skipped and its recorded outputs are reused; the TTS stage
+    is checkpointed per segment, so only unfinished segments are synthesized again.
+
+    Agents, the render pool and per-stage concurrency slots can be injected so that several
+    pipelines share them (see batch.py); a stage listed in stage_slots runs only while
+    holding its semaphore.
+    """
+
+    def __init__(self, pdf_path: str, resume: bool = False, manifest_dir: str = "config/runs",
+                 audio_dir: str = "data/audio", project_file: str = "config/recap_project.json",
+                 parallel_render: bool = True, render_workers: Optional[int] = None,
+                 tts_requests_per_minute: float = 10, screen_size=layout.DEFAULT_SCREEN_SIZE,
+                 render_queue_size: int = 8, refresh_analysis: bool = False, prefetch_tts: bool = True,
+                 vision_agent: Optional["VisionAgent"] = None,
+                 audio_gen: Optional["AudioGenerator"] = None, context_agent: Optional["ContextAgent"] = None,
+                 render_pool: Optional[ProcessPoolExecutor] = None, pdf_processor: Optional["PDFProcessor"] = None,
+                 output_dir: str = "output", report_path: Optional[str] = None,
+                 trace_path: Optional[str] = None, encoder_profile: str = DEFAULT_ENCODER_PROFILE,
+                 preview: bool = False, preview_segments: Optional[List[int]] = None,
+                 background_cache_dir: Optional[str] = layout.BACKGROUND_CACHE_DIR,
+                 stage_slots: Optional[Dict[str, threading.Semaphore]] = None):
+        self.pdf_path = pdf_path
+        self.pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        self.resume = resume
+        self.audio_dir = audio_dir
+        self.project_file = project_file
+        self.parallel_render = parallel_render
+        self.render_workers = render_workers
+        self.render_queue_size = render_queue_size
+        self.refresh_analysis = refresh_analysis
+        self.prefetch_tts = prefetch_tts
+        # Segment index -> TTS future started while the analysis was still streaming
+        self.prefetched = {}
+        self.tts_requests_per_minute = tts_requests_per_minute
+        self.screen_size = tuple(screen_size)
+        self.encoder_profile = encoder_profile
+        # Preview runs end with a low-resolution proxy of some or all segments instead of the final render
+        self.preview = preview
+        self.preview_segments = preview_segments
+        self.background_cache_dir = background_cache_dir
+        self.render_pool = render_pool
+        self.pdf_processor = pdf_processor
+        self.output_dir = output_dir
+        # Run report (JSON) and Chrome trace of this run's spans, written when run() ends
+        self.report_path = report_path
+        self.trace_path = trace_path
+        self.stage_slots = stage_slots or {}
+        self.manifest = RunManifest(os.path.join(manifest_dir, f"{self.pdf_name}.json"))
+        self.pdf_hash = file_sha256(pdf_path)
+
+        # Agents are created on first use, so skipped stages never build API clients
+        self._vision_agent = vision_agent
+        self._audio_gen = audio_gen
+        self._context_agent = context_agent
+
+        self.image_paths: List[str] = []
+        self.context_text = ""
+        self.segments: List[dict] = []
+        self.batches_data: List[dict] = []
+        self.final_path: Optional[str] = None
+
+    @property
+    def vision_agent(self) -> "VisionAgent":
+        if self._vision_agent is None:
+            from vision_agent import VisionAgent
+            self._vision_agent = VisionAgent()
+        return self._vision_agent
+
+    @property
+    def audio_gen(self) -> "AudioGenerator":
+        if self._audio_gen is None:
+            from audio_generator import AudioGenerator
+            self._audio_gen = AudioGenerator(requests_per_minute=self.tts_requests_per_minute)
+        return self._audio_gen
+
+    @property
+    def context_agent(self) -> "ContextAgent":
+        if self._context_agent is None:
+            from context_agent import ContextAgent
+            self._context_agent = ContextAgent()
+        return self._context_agent
+
+    def run(self) -> Optional[str]:
+        started = time.time()
+        status = "failed"
+        try:
+            # The web lookup and the PDF upload don't need the page images: both run during extraction
+            with ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch") as pool:
+                context = pool.submit(self._stage_context)
+                pool.submit(self._prefetch_upload, context)
+                self._stage_extract()
+                context.result()
+            self._stage_analyze()
+            if self.preview:
+                self._stage_tts()
+                self._stage_preview()
+            elif self.parallel_render:
+                # Segments start rendering while later narration is still being synthesized
+                self._stage_tts_and_render()
+            else:
+                self._stage_tts()
+                self._stage_render()
+            status = "done"
+            return self.final_path
+        finally:
+            self._write_report(started, status)
+
+    def _write_report(self, started: float, status: str):
+        if self.report_path:
+            tracer.write_report(self.report_path, since=started, pdf_path=self.pdf_path, status=status,
+                                final_path=self.final_path, wall_s=round(time.time() - started, 3),
+                                segments=len(self.segments))
+        if self.trace_path:
+            tracer.write_chrome_trace(self.trace_path, since=started)
+
+    def _run_stage(self, stage: str, inputs: str, func: Callable[[], dict], force: bool = False) -> dict:
+        if self.resume and not force and self.manifest.is_done(stage, inputs):
+            print(f"\n[{stage}] Already completed, reusing recorded outputs.")
+            tracer.record(f"stage.{stage}", time.time(), skipped=True)
+            return self.manifest.get(stage)["outputs"]
+
+        self.manifest.update(stage, status="running", inputs=inputs)
+        try:
+            with span(f"stage.{stage}") as s:
+                slot = self.stage_slots.get(stage)
+                if slot is None:
+                    outputs = func()
+                else:
+                    with slot:
+                        s.set(slot_wait_s=round(time.time() - s.start, 3))
+                        outputs = func()
+        except Exception:
+            self.manifest.update(stage, status="failed")
+            raise
+        self.manifest.update(stage, status="done", outputs=outputs)
+        return outputs
+
+    # --- STAGES ---
+
+    def _pdf_processor(self) -> "PDFProcessor":
+        if self.pdf_processor is None:
+            from pdf_processor import PDFProcessor
+            self.pdf_processor = PDFProcessor()
+        return self.pdf_processor
+
+    def _stage_extract(self):
+        def extract():
+            # Rendered at video resolution, with pre-scaled layers
+            processor = self._pdf_processor()
+            return {"image_paths": processor.extract_images(self.pdf_path, screen_size=self.screen_size)}
+
+        inputs = text_sha256(self.pdf_hash, self.screen_size)
+        outputs = self._run_stage("extract", inputs, extract)
+        if not all(os.path.exists(p) for p in outputs["image_paths"]):
+            # Recorded pages were deleted since; the page cache re-renders only the missing ones
+            processor = self._pdf_processor()
+            outputs = {"image_paths": processor.extract_images(self.pdf_path, screen_size=self.screen_size)}
+            self.manifest.update("extract", outputs=outputs)
+        self.image_paths = outputs["image_paths"]
+
+    def _stage_context(self):
+        # Derive query from filename (e.g. "chapetre-28.pdf" -> "chapetre-28 summary")
+        # Better: user should name file "Boruto_Chapter_28.pdf"
+        base_name = os.path.basename(self.pdf_path).replace(".pdf", "").replace("_", " ").replace("-", " ")
+        query = f"{base_name} manga chapter summary plot characters"
+
+        def fetch_context():
+            # --- SMART CONTEXT FETCHING ---
+            context_text = ""
+            if self.context_agent.client:
+                print(f"\n[Smart Context] Searching for: '{query}'...")
+                context_text = self.context_agent.get_context(query)
+                if context_text:
+                    print(f"[Smart Context] Found external context ({len(context_text)} chars).")
+                else:
+                    print("[Smart Context] No context found or API missing.")
+            return {"context_text": context_text}
+
+        self.context_text = self._run_stage("context", text_sha256(query), fetch_context)["context_text"]
+
+    def _prefetch_upload(self, context: Future):
+        """
+        Uploads the PDF ahead of the analysis, unless the analysis will not need it: resumed
+        after it completed, or a hit in the analysis cache. The cache key includes the story
+        context, so this waits for the context lookup first.
+        """
+        if self.resume and (self.manifest.get("analyze") or {}).get("status") == "done":
+            return
+        try:
+            context.result()
+        except Exception:
+            return  # run() raises it
+        if not self.refresh_analysis and os.path.exists(
+                self.vision_agent.analysis_path(self.pdf_path, self.context_text)):
+            return
+        try:
+            self.vision_agent.upload(self.pdf_path)
+        except Exception as e:
+            print(f"Warning: early PDF upload failed, retrying during analysis: {e}")
+
+    def _stage_analyze(self):
+        def prefetch(i, seg):
+            # Narration starts as soon as a segment is final; _stage_tts collects the result
+            job = self._segment_job(i, seg)
+            os.makedirs(self.audio_dir, exist_ok=True)
+            self.prefetched[i] = (job, self.audio_gen.submit(job))
+
+        def analyze():
+            print("\nStarting AI Analysis of the PDF...")
+            segments = self.vision_agent.analyze_pdf(self.pdf_path, story_context=self.context_text,
+                                                     refresh=self.refresh_analysis, page_count=len(self.image_paths),
+                                                     on_segment=prefetch if self.prefetch_tts else None)
+            print(f"\nAnalysis complete. Generated {len(segments)} narrative segments.")
+            return {"segments": segments}
+
+        inputs = text_sha256(self.pdf_hash, self.context_text)
+        self.segments = self._run_stage("analyze", inputs, analyze, force=self.refresh_analysis)["segments"]
+
+    @traced("stage.tts")
+    def _stage_tts(self, on_ready: Optional[Callable[[int, dict], None]] = None):
+        """
+        on_ready(index, batch) is called for every segment whose narration is available,
+        reused ones first, then new ones as they finish.
+        """
+        # 3. Process Segments and Generate Audio
+        print("\nGenerating Audio Narration (Per Segment)...")
+        os.makedirs(self.audio_dir, exist_ok=True)
+        batches, jobs = self._plan_segments()
+
+        done = (self.manifest.get("tts") or {}).get("segments", {}) if self.resume else {}
+        job_keys = [text_sha256(job["script_text"], job["style_text"]) for job in jobs]
+        # Jobs started while the analysis streamed are awaited like new ones, never blocked on up front
+        prefetched = {job["output_path"]: future for job, future in self.prefetched.values()}
+        self.prefetched = {}
+        futures = {}
+        pending = []
+        reused = []
+        for i, job in enumerate(jobs):
+            if job["output_path"] in prefetched:
+                futures[prefetched[job["output_path"]]] = i
+            elif done.get(job["output_path"], {}).get("inputs") == job_keys[i] and is_complete_wav(job["output_path"]):
+                reused.append(i)
+            else:
+                pending.append(i)
+        if reused:
+            print(f"[tts] Reusing {len(reused)} finished segments.")
+        if on_ready:
+            for i in reused:
+                on_ready(i, batches[i])
+
+        self.manifest.update("tts", status="running", segments=done)
+        # TTS calls run concurrently; the generator's rate limiter paces them to the API quota.
+        # Each finished segment is checkpointed and handed on as soon as it completes.
+        for i in pending:
+            futures[self.audio_gen.submit(jobs[i])] = i
+        failed = set()
+        for future in as_completed(futures):
+            i = futures[future]
+            if future.result():
+                done[jobs[i]["output_path"]] = {"inputs": job_keys[i]}
+                self.manifest.update("tts", segments=done)
+                if on_ready:
+                    on_ready(i, batches[i])
+            else:
+                failed.add(i)
+
+        self.batches_data = [batch for i, batch in enumerate(batches) if i not in failed]
+        self.manifest.update("tts", status="failed" if failed else "done", segments=done)
+
+        # Save project state for debugging/reuse (and for assemble.py) before the long render
+        recap_data = {"pdf_name": self.pdf_name, "batches": self.batches_data}
+        os.makedirs(os.path.dirname(self.project_file) or ".", exist_ok=True)
+        with open(self.project_file, "w") as f:
+            json.dump(recap_data, f, indent=4)
+
+    def _plan_segments(self):
+        """
+        Maps analysis segments to page images and audio jobs.
+        Returns (batches, jobs), aligned by index.
+        """
+        batches = []
+        jobs = []
+        for i, seg in enumerate(self.segments):
+            start_page = seg.get('start_page', 1)
+            end_page = seg.get('end_page', 1)
+            script = seg.get('script', "")
+            mood = seg.get('mood', "Neutral")
+
+            print(f"Processing Segment {i+1}: Pages {start_page}-{end_page} [{mood}]")
+
+            # Identify corresponding images (1-based index to 0-based list)
+            # Ensure indices are within bounds
+            start_idx = max(0, start_page - 1)
+            end_idx = min(len(self.image_paths), end_page)
+
+            segment_images = self.image_paths[start_idx:end_idx]
+
+            if not segment_images:
+                print(f"Warning: No images found for pages {start_page}-{end_page}")
+                continue
+
+            job = self._segment_job(i, seg)
+            audio_path = job["output_path"]
+
+            # Create batch item
+            # We store the segment script in the first item or just carrying it in the batch is enough
+            # But specific items structure is expected by VideoEditor to find images
+            batch_items = []
+            for img in segment_images:
+                batch_items.append({
+                    "image_path": img,
+                    "script": script # redundant but keeps structure
+                })
+
+            batches.append({
+                "segment": i + 1,
+                "audio_path": audio_path,
+                "items": batch_items,
+                "segment_script": script,
+                "mood": mood
+            })
+            jobs.append(job)
+        return batches, jobs
+
+    def _segment_job(self, i: int, seg: dict) -> dict:
+        return {
+            "script_text": seg.get('script', ""),
+            "style_text": seg.get('style_instructions', ""),
+            "output_path": os.path.join(self.audio_dir, f"segment_{i+1:03d}.wav")
+        }
+
+    def _stage_render(self):
+        # 5. Assemble Video
+        if not self.batches_data:
+            print("No audio generated, skipping video assembly.")
+            return
+
+        output_name = f"{self.pdf_name}_recap.mp4"
+
+        def render():
+            from video_editor import VideoEditor
+            print("\nAssembling Final Video...")
+            editor = VideoEditor(output_dir=self.output_dir, screen_size=self.screen_size,
+                                 encoder_profile=self.encoder_profile,
+                                 background_cache_dir=self.background_cache_dir)
+            # Segments render in parallel and are stitched losslessly
+            final_path = editor.create_video(self.batches_data, output_filename=output_name,
+                                             parallel=self.parallel_render, workers=self.render_workers)
+            return {"final_path": final_path}
+
+        outputs = self._run_stage("render", self._render_inputs(output_name), render)
+        if outputs["final_path"] and not os.path.exists(outputs["final_path"]):
+            outputs = render()
+            self.manifest.update("render", outputs=outputs)
+        self.final_path = outputs["final_path"]
+
+    def _render_inputs(self, output_name: str) -> str:
+        audio_hashes = [file_sha256(b["audio_path"]) for b in self.batches_data if os.path.exists(b["audio_path"])]
+        return text_sha256(self.batches_data, audio_hashes, self.screen_size, self.encoder_profile, output_name)
+
+    @traced("stage.preview")
+    def _stage_preview(self):
+        """
+        Review proxy of the narrated segments (see VideoEditor.for_preview). Not recorded in the
+        manifest: it is cheap, and never stands in for the final render.
+        """
+        if not self.batches_data:
+            print("No audio generated, skipping preview.")
+            return
+        from video_editor import VideoEditor
+        suffix = "".join(f"_{n}" for n in sorted(self.preview_segments)) if self.preview_segments else ""
+        print("\nRendering Preview...")
+        editor = VideoEditor.for_preview(output_dir=os.path.join(self.output_dir, "previews"),
+                                         screen_size=self.screen_size,
+                                         background_cache_dir=self.background_cache_dir)
+        self.final_path = editor.create_preview(self.batches_data, f"{self.pdf_name}_preview{suffix}.mp4",
+                                                segments=self.preview_segments)
+
+    @traced("stage.tts_and_render")
+    def _stage_tts_and_render(self):
+        """
+        Producer/consumer overlap of the tts and render stages: finished segments flow through
+        a bounded queue into VideoEditor.create_video_as_ready, whose process pool renders them
+        while later TTS calls are still in flight. The final stitch runs once TTS is done.
+        """
+        if self.resume and (self.manifest.get("tts") or {}).get("status") == "done":
+            # The narration is already on disk, so there is nothing to overlap; the render stage
+            # reuses the recorded video when its inputs are unchanged
+            self._stage_tts()
+            self._stage_render()
+            return
+
+        from video_editor import VideoEditor
+        output_name = f"{self.pdf_name}_recap.mp4"
+        editor = VideoEditor(output_dir=self.output_dir, screen_size=self.screen_size,
+                             encoder_profile=self.encoder_profile,
+                             background_cache_dir=self.background_cache_dir)
+        ready = queue.Queue(maxsize=self.render_queue_size)
+        outcome = {}
+        producer_done = threading.Event()
+
+        def ready_batches():
+            yield from iter(ready.get, None)
+            producer_done.set()
+
+        def consume():
+            try:
+                outcome["final_path"] = editor.create_video_as_ready(
+                    ready_batches(), output_name, self.render_workers, pool=self.render_pool)
+            except Exception as e:
+                outcome["error"] = e
+                # Keep draining so the TTS producer never blocks on a dead consumer. The render can
+                # also fail after the end marker was taken (failed segments, stitching): then stop.
+                while not producer_done.is_set() and ready.get() is not None:
+                    pass
+
+        print("\nAssembling Final Video (segments render as their narration completes)...")
+        self.manifest.update("render", status="running")
+        consumer = threading.Thread(target=consume, name="segment-render")
+        consumer.start()
+        try:
+            self._stage_tts(on_ready=lambda i, batch: ready.put((i, batch)))
+        finally:
+            ready.put(None)
+            consumer.join()
+
+        if "error" in outcome:
+            self.manifest.update("render", status="failed")
+            raise outcome["error"]
+        self.final_path = outcome["final_path"]
+        # Same inputs record as _stage_render, so a resumed run can skip this render
+        self.manifest.update("render", status="done", inputs=self._render_inputs(output_name),
+                             outputs={"final_path": self.final_path})
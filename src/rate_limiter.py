@@ -0,0 +1,78 @@
+import time
+import random
+import threading
+from typing import Callable, TypeVar
+
+T = TypeVar("T")
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket: allows `requests_per_minute` on average, with bursts of up to
+    `burst` requests. One instance can be shared by every thread hitting the same API quota.
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int = 1):
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute must be positive")
+        self.rate = requests_per_minute / 60.0  # tokens per second
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Blocks until a token is available and takes it.
+        Returns the number of seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait_time = (1 - self.tokens) / self.rate
+            time.sleep(wait_time)
+            waited += wait_time
+
+    def call_with_backoff(self, fn: Callable[[], T], label: str, max_retries: int = 3, base: float = 10,
+                          span=None) -> T:
+        """
+        Calls fn() once a token is available. Quota errors (is_rate_limit_error) are retried after
+        backoff_delay, up to max_retries attempts in all; other errors, and the last quota error,
+        are raised. Time spent waiting and retrying is added to `span` (rate_wait_s, retries, sleep_s).
+        """
+        for attempt in range(max_retries):
+            waited = self.acquire()
+            if span is not None:
+                span.add("rate_wait_s", waited)
+            try:
+                return fn()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt + 1 >= max_retries:
+                    raise
+                wait_time = backoff_delay(attempt, base=base)
+                print(f"\nQuota exceeded for {label}. Retrying in {wait_time:.1f}s... "
+                      f"(Attempt {attempt + 1}/{max_retries})")
+                if span is not None:
+                    span.add("retries")
+                    span.add("sleep_s", wait_time)
+                time.sleep(wait_time)
+
+
+def backoff_delay(attempt: int, base: float = 2.0, cap: float = 60.0) -> float:
+    """
+    Exponential backoff with jitter for retry `attempt` (0-based): a random delay in
+    [d/2, d] where d = min(cap, base * 2**attempt), so concurrent callers spread out.
+    """
+    delay = min(cap, base * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    error_msg = str(error)
+    return "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg
@@ -1,159 +1,361 @@
 import os
-import math
-from moviepy import ImageClip, AudioFileClip, concatenate_videoclips, CompositeVideoClip, ColorClip, VideoFileClip, CompositeAudioClip
-from moviepy.video.fx import FadeIn
-from typing import List, Tuple
+import time
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from typing import Iterable, List, Optional, Tuple
+from frame_renderer import PageSequence, BACKGROUND_OPACITY, BACKGROUND_BLUR, INFINITY_AMPLITUDE
+from ffmpeg_tools import concat_videos, encoder_profile, FFmpegFrameWriter, DEFAULT_ENCODER_PROFILE
+from cache import BlobCache, file_sha256, text_sha256
+from audio_mixer import AudioMixer
+from instrumentation import process_usage, span, tracer
+from workers import process_pool
+import layout
+
+# Prepare Background Music Library
+MUSIC_DIR = "assets/music"
+MUSIC_GAIN = 0.20  # Ducking: Voice 100%, Music 20%
+FADE_IN_DURATION = 0.5
+# Bump when rendering code changes in a way the parameters below do not capture
+RENDER_VERSION = 4
+BACKGROUND_CACHE_MAX_BYTES = 1024 ** 3
+# Rendered segments in <output_dir>/segments, kept for reuse across runs
+SEGMENT_CACHE_MAX_BYTES = 4 * 1024 ** 3
+# Decoded mood tracks, shared by the parent and its render workers
+MUSIC_CACHE_DIR = "data/cache/music"
+# Review proxies (VideoEditor.for_preview): same timeline and mix, smaller and cheaper to encode
+PREVIEW_HEIGHT = 360
+PREVIEW_FPS = 12
+PREVIEW_ENCODER_PROFILE = "draft"
+
+
+def _render_segment_worker(settings: dict, batch: dict, output_path: str) -> Tuple[Optional[str], List[dict], Tuple[int, dict]]:
+    # Process-pool entry point: renderers hold image buffers and file handles, so each worker builds its own.
+    # The worker's spans and resource usage (with its ffmpeg children's) travel back with the result
+    tracer.drain()
+    path = VideoEditor(**settings).render_segment(batch, output_path)
+    return path, tracer.drain(), (os.getpid(), process_usage())
+
 
 class VideoEditor:
-    def __init__(self, output_dir: str = "output"):
+    def __init__(self, output_dir: str = "output", screen_size: Tuple[int, int] = layout.DEFAULT_SCREEN_SIZE,
+                 encoder_profile: str = DEFAULT_ENCODER_PROFILE, fps: int = 24,
+                 amplitude: Tuple[float, float] = INFINITY_AMPLITUDE, draft: bool = False,
+                 background_cache_dir: Optional[str] = layout.BACKGROUND_CACHE_DIR,
+                 music_cache_dir: Optional[str] = MUSIC_CACHE_DIR):
         self.output_dir = output_dir
         os.makedirs(self.output_dir, exist_ok=True)
-        self.screen_size = (1920, 1080)
+        self.screen_size = tuple(screen_size)
+        self.fps = fps
+        # Named x264 settings from ffmpeg_tools.ENCODER_PROFILES
+        self.encoder_profile = encoder_profile
+        # Figure-8 drift of the foreground, in pixels of this screen size
+        self.amplitude = tuple(amplitude)
+        # Faster, lower-quality page scaling (see CinematicRenderer)
+        self.draft = draft
+        # Blurred page backgrounds, shared by every run and render worker
+        self.background_cache_dir = background_cache_dir
+        self.background_cache = (BlobCache(background_cache_dir, max_bytes=BACKGROUND_CACHE_MAX_BYTES, suffix=".png")
+                                 if background_cache_dir else None)
+        # Each render worker builds its own editor and mixer; they memory-map the mood tracks the
+        # parent decoded into music_cache_dir (see create_video_as_ready) instead of decoding them again
+        self.music_cache_dir = music_cache_dir
+        self.mixer = AudioMixer(music_gain=MUSIC_GAIN, cache_dir=music_cache_dir)
 
-    def create_video(self, batches: List[dict], output_filename: str = "final_recap.mp4"):
+    @classmethod
+    def for_preview(cls, output_dir: str = "output",
+                    screen_size: Tuple[int, int] = layout.DEFAULT_SCREEN_SIZE,
+                    background_cache_dir: Optional[str] = layout.BACKGROUND_CACHE_DIR) -> "VideoEditor":
+        """
+        Editor for quick review proxies of a screen_size video: PREVIEW_HEIGHT lines at
+        PREVIEW_FPS with the draft encoder profile and draft page scaling. Page timings and the
+        audio mix are the same as the full render's, and the motion is scaled down with the picture.
+        """
+        scale = PREVIEW_HEIGHT / screen_size[1]
+        # x264 needs even dimensions
+        size = (max(2, round(screen_size[0] * scale / 2) * 2), PREVIEW_HEIGHT)
+        return cls(output_dir=output_dir, screen_size=size, encoder_profile=PREVIEW_ENCODER_PROFILE,
+                   fps=PREVIEW_FPS, amplitude=(INFINITY_AMPLITUDE[0] * scale, INFINITY_AMPLITUDE[1] * scale),
+                   draft=True, background_cache_dir=background_cache_dir)
+
+    def create_video(self, batches: List[dict], output_filename: str = "final_recap.mp4",
+                     parallel: bool = False, workers: Optional[int] = None):
         """
         batches: List of dictionaries, each containing:
             - 'audio_path': path to a single audio file for the whole batch
             - 'items': List of dictionaries, each with:
                 - 'image_path': path to image
                 - 'script': text used for word counting
+        parallel: render each batch to its own MP4 in a process pool, then stitch
+                  them with the ffmpeg concat demuxer (no re-encode). Segment files are
+                  keyed by segment_fingerprint(), so re-runs only re-encode changed batches.
         """
-        video_clips = []
-        
-        # Prepare Background Music Library
-        music_dir = "assets/music"
+        if parallel:
+            return self._create_video_parallel(batches, output_filename, workers)
+
+        output_path = os.path.join(self.output_dir, output_filename)
+        audio_path = self._mix_path(output_path)
+        # Pages are kept as (image, duration) and the mix is streamed to disk batch by batch;
+        # nothing is rendered or held in memory until the encoder asks for it
+        pages = []
+        with self.mixer.wav_writer(audio_path) as wav:
+            for batch in batches:
+                batch_pages, track = self._build_batch(batch)
+                if batch_pages:
+                    pages.extend(batch_pages)
+                    wav.write(self.mixer.to_pcm(track))
+
+        if not pages:
+            os.remove(audio_path)
+            print("No clips to assemble!")
+            return None
+
+        print(f"Finalizing video assembly with {len(pages)} clips...")
+        self._write_pages(pages, audio_path, output_path)
         
-        for batch in batches:
-            aud_path = batch['audio_path']
-            items = batch['items']
-            mood = batch.get('mood', 'Neutral')
-            
-            if not os.path.exists(aud_path):
-                print(f"Warning: Skipping batch, missing audio: {aud_path}")
-                continue
-
-            # Load full audio (Voice)
-            voice_audio = AudioFileClip(aud_path)
-            total_duration = voice_audio.duration
-            
-            # --- BACKGROUND MUSIC MIXING ---
-            bg_music = None
-            music_file = os.path.join(music_dir, f"{mood}.mp3")
-            
-            # Fallback to Neutral/Action if specific mood missing, or None
-            if not os.path.exists(music_file):
-                 music_file = os.path.join(music_dir, "Neutral.mp3")
-            
-            if os.path.exists(music_file):
-                try:
-                    music = AudioFileClip(music_file)
-                    # Loop if music is shorter than extraction
-                    if music.duration < total_duration:
-                        music = concatenate_videoclips([music] * (int(total_duration / music.duration) + 1)).audio
-                    
-                    music = music.subclipped(0, total_duration)
-                    # Ducking: Voice 100%, Music 20%
-                    music = music.with_volume_scaled(0.20)
-                    
-                    # Mix voice and music
-                    full_audio = CompositeAudioClip([voice_audio, music])
-                except Exception as e:
-                    print(f"Error loading music {music_file}: {e}")
-                    full_audio = voice_audio
-            else:
-                full_audio = voice_audio
-            
-            # Equal distribution of duration
-            num_images = len(items)
-            if num_images == 0:
-                continue
-                
-            clip_duration = total_duration / num_images
-            
-            # Start time for audio sub-clips
-            current_time = 0
-            
-            for i, item in enumerate(items):
-                img_path = item['image_path']
-                if not os.path.exists(img_path):
+        print(f"Video saved to: {output_path}")
+        return output_path
+
+    def render_segment(self, batch: dict, output_path: str) -> Optional[str]:
+        """
+        Renders a single batch to its own MP4 with the same codec parameters as the final video,
+        so segment files can be stitched without re-encoding.
+        """
+        with span("render.segment", output=output_path, pages=len(batch['items'])):
+            pages, track = self._build_batch(batch)
+            if not pages:
+                return None
+            # Rendered under a temp name so an interrupted encode is never mistaken for a finished segment
+            tmp_path = f"{os.path.splitext(output_path)[0]}.part.mp4"
+            audio_path = self.mixer.write_wav(track, self._mix_path(tmp_path))
+            del track
+            try:
+                self._write_pages(pages, audio_path, tmp_path)
+            except BaseException:
+                # A failed encode leaves nothing behind in the segment store
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            os.replace(tmp_path, output_path)
+            return output_path
+
+    def create_preview(self, batches: List[dict], output_filename: str,
+                       segments: Optional[Iterable[int]] = None) -> Optional[str]:
+        """
+        Single-pass render of the batches whose 'segment' number is in `segments` (all when
+        None), back to back. Meant for an editor from for_preview().
+        """
+        if segments is not None:
+            segments = set(segments)
+            batches = [batch for batch in batches if batch.get('segment') in segments]
+        with span("render.preview", batches=len(batches), fps=self.fps, height=self.screen_size[1]):
+            return self.create_video(batches, output_filename)
+
+    def _create_video_parallel(self, batches: List[dict], output_filename: str, workers: Optional[int]):
+        return self.create_video_as_ready(enumerate(batches), output_filename, workers)
+
+    def create_video_as_ready(self, ready_batches: Iterable[Tuple[int, dict]], output_filename: str,
+                              workers: Optional[int] = None,
+                              pool: Optional[ProcessPoolExecutor] = None) -> Optional[str]:
+        """
+        Segment-mode render fed incrementally: ready_batches yields (index, batch) pairs in any
+        order, e.g. as their narration finishes, and each is handed to the render pool right away.
+        Segments are stitched in index order once the iterable is exhausted.
+
+        Segment encodes are content-addressed by segment_fingerprint(), so unchanged
+        segments are reused instead of re-rendered; the store is capped at SEGMENT_CACHE_MAX_BYTES.
+        If any segment fails, RuntimeError is raised after the others finish, and nothing is stitched.
+
+        A shared `pool` (e.g. one per batch of chapters) is used as is and left running;
+        otherwise a pool of `workers` processes is created for this call.
+        """
+        segment_cache = BlobCache(os.path.join(self.output_dir, "segments"),
+                                  max_bytes=SEGMENT_CACHE_MAX_BYTES, suffix=".mp4")
+        workers = workers or os.cpu_count() or 1
+
+        segment_paths = {}
+        fingerprints = []
+        failed = {}
+        reused = 0
+        with (nullcontext(pool) if pool else process_pool(workers)) as pool:
+            futures = {}
+
+            def collect(done):
+                for future in done:
+                    i = futures.pop(future)
+                    try:
+                        segment_paths[i], spans, usage = future.result()
+                        tracer.extend(spans)
+                        tracer.add_worker_usage(*usage)
+                    except Exception as e:
+                        # Reported once every segment is done; the others are kept on disk for a re-run
+                        print(f"Error rendering segment {i+1}: {e}")
+                        failed[i] = e
+                    else:
+                        if segment_paths[i]:
+                            print(f"Segment {i+1} rendered: {segment_paths[i]}")
+
+            for i, batch in ready_batches:
+                if not os.path.exists(batch['audio_path']):
+                    print(f"Warning: Skipping batch, missing audio: {batch['audio_path']}")
                     continue
-                
-                # Extract audio part
-                sub_audio = full_audio.subclipped(current_time, current_time + clip_duration)
-                current_time += clip_duration
-
-                # Create Cinematic Clip
-                clip = self._create_cinematic_clip(img_path, clip_duration)
-                clip = clip.with_audio(sub_audio)
-                
-                # Apply FadeIn to the composite clip
-                clip = clip.with_effects([FadeIn(0.5)])
-                
-                video_clips.append(clip)
-
-        if not video_clips:
+                fingerprint = self.segment_fingerprint(batch)
+                fingerprints.append(fingerprint)
+                path = segment_cache.path_for(fingerprint)
+                if segment_cache.touch(fingerprint):
+                    segment_paths[i] = path
+                    reused += 1
+                    continue
+                self._preload_music(batch)
+                # Bound the backlog so a slow render pool pushes back on the producer
+                if len(futures) >= workers * 2:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    collect(done)
+                futures[pool.submit(_render_segment_worker, self.settings(), batch, path)] = i
+
+            collect(list(futures))
+
+        # Least recently used segments of earlier runs go first; this run's are kept for a re-run
+        segment_cache.trim(keep=fingerprints)
+
+        if failed:
+            # Never stitch a recap with holes: a re-run reuses the finished segments and retries these
+            numbers = ", ".join(str(i + 1) for i in sorted(failed))
+            first = failed[min(failed)]
+            raise RuntimeError(f"{len(failed)} segment(s) failed to render ({numbers}); "
+                               f"first error: {type(first).__name__}: {first}")
+
+        segment_paths = [segment_paths[i] for i in sorted(segment_paths) if segment_paths[i]]
+        if not segment_paths:
             print("No clips to assemble!")
             return None
 
-        print(f"Finalizing video assembly with {len(video_clips)} clips...")
-        final_video = concatenate_videoclips(video_clips, method="compose")
-        
+        print(f"Stitching {len(segment_paths)} segments ({reused} reused)...")
         output_path = os.path.join(self.output_dir, output_filename)
-        # Using preset='fast' to speed up render slightly
-        final_video.write_videofile(output_path, fps=24, codec="libx264", audio_codec="aac", preset="fast")
-        
+        with span("render.stitch", segments=len(segment_paths), reused=reused) as s:
+            concat_videos(segment_paths, output_path)
+            s.set(bytes_out=os.path.getsize(output_path))
+
         print(f"Video saved to: {output_path}")
         return output_path
 
-    def _create_cinematic_clip(self, image_path: str, duration: float):
-        img = ImageClip(image_path)
-        img_w, img_h = img.size
-        screen_w, screen_h = self.screen_size
-        
-        # --- BACKGROUND (Blurred & Filling Screen) ---
-        ratio_bg = max(screen_w / img_w, screen_h / img_h)
-        bg_w = int(img_w * ratio_bg)
-        bg_h = int(img_h * ratio_bg)
-        
-        bg = img.resized((bg_w, bg_h))
-        
-        # Center Crop BG
-        x_center, y_center = bg_w / 2, bg_h / 2
-        x1 = x_center - screen_w / 2
-        y1 = y_center - screen_h / 2
-        bg = bg.cropped(x1=x1, y1=y1, width=screen_w, height=screen_h)
-
-        # Darken Background
-        bg = bg.with_opacity(0.3)
-        
-        # --- FOREGROUND (Main Image, Fit Height + Infinity Move) ---
-        ratio_fg = min(screen_w / img_w, screen_h / img_h)
-        final_ratio_fg = ratio_fg * 1.10 # 10% margin for movement
-        
-        new_w = int(img_w * final_ratio_fg)
-        new_h = int(img_h * final_ratio_fg)
-        
-        fg = img.resized((new_w, new_h))
-        
-        center_x, center_y = screen_w / 2, screen_h / 2
+    def segment_fingerprint(self, batch: dict) -> str:
+        """
+        Hash of everything a segment encode depends on: audio and image content, the music
+        track, and the render/effect parameters. Changing any of them yields a new segment file.
+        """
+        music_file = self._music_file(batch.get('mood', 'Neutral'))
+        images = [
+            (item['image_path'], file_sha256(item['image_path']) if os.path.exists(item['image_path']) else None)
+            for item in batch['items']
+        ]
+        return text_sha256(
+            RENDER_VERSION,
+            file_sha256(batch['audio_path']),
+            images,
+            (music_file, file_sha256(music_file)) if music_file else None,
+            self.render_params(),
+        )
+
+    def settings(self) -> dict:
+        """
+        Constructor arguments reproducing this editor, e.g. in a render worker process.
+        """
+        return {"output_dir": self.output_dir, "screen_size": self.screen_size,
+                "encoder_profile": self.encoder_profile, "fps": self.fps, "amplitude": self.amplitude,
+                "draft": self.draft, "background_cache_dir": self.background_cache_dir,
+                "music_cache_dir": self.music_cache_dir}
+
+    def render_params(self) -> dict:
+        return {
+            "screen_size": list(self.screen_size),
+            "fps": self.fps,
+            "codec": "libx264",
+            "audio_codec": "aac",
+            "encoder_profile": self.encoder_profile,
+            "encoder": encoder_profile(self.encoder_profile),
+            "fade_in": FADE_IN_DURATION,
+            "music_gain": MUSIC_GAIN,
+            "audio_sample_rate": self.mixer.sample_rate,
+            "background_opacity": BACKGROUND_OPACITY,
+            "background_blur": BACKGROUND_BLUR,
+            "infinity_amplitude": list(self.amplitude),
+            "draft": self.draft,
+            "foreground_margin": layout.FOREGROUND_MARGIN,
+        }
+
+    def _music_file(self, mood: str) -> Optional[str]:
+        music_file = os.path.join(MUSIC_DIR, f"{mood}.mp3")
         
-        def infinity_movement(t):
-            u = (2 * math.pi * t) / duration
-            A_x = 80
-            A_y = 40
-            x = A_x * math.sin(u)
-            y = A_y * math.sin(2 * u)
-            return x, y
-
-        def pos_func(t):
-            dx, dy = infinity_movement(t)
-            return (center_x - new_w/2 + dx, center_y - new_h/2 + dy)
+        # Fallback to Neutral/Action if specific mood missing, or None
+        if not os.path.exists(music_file):
+             music_file = os.path.join(MUSIC_DIR, "Neutral.mp3")
+        return music_file if os.path.exists(music_file) else None
+
+    def _preload_music(self, batch: dict):
+        """
+        Decodes the batch's mood track into the music cache before a worker needs it,
+        so each track is decoded once per run rather than once per segment.
+        """
+        music_file = self._music_file(batch.get('mood', 'Neutral'))
+        if not music_file or not self.music_cache_dir:
+            return
+        try:
+            self.mixer.load_track(music_file)
+        except Exception:
+            pass  # The worker's mix() reports it and falls back to the narration alone
+
+    @staticmethod
+    def _mix_path(output_path: str) -> str:
+        return f"{os.path.splitext(output_path)[0]}.mix.wav"
+
+    def _write_pages(self, pages: List[Tuple[str, float]], audio_path: str, output_path: str):
+        """
+        Encodes the pages as one cinematic timeline muxed with the pre-mixed audio file, which
+        is removed afterwards. Frames come from a PageSequence, so only one page's layers are in
+        memory at a time, and go straight from its buffers into the ffmpeg pipe.
+        """
+        sequence = PageSequence(pages, self.screen_size, fade_in=FADE_IN_DURATION, amplitude=self.amplitude,
+                                draft=self.draft, background_cache=self.background_cache)
+        frames = int(sequence.duration * self.fps)
+        try:
+            with span("render.encode", frames=frames, pages=len(pages), profile=self.encoder_profile) as s:
+                with FFmpegFrameWriter(output_path, self.screen_size, self.fps, self.encoder_profile,
+                                       audio_path=audio_path) as writer:
+                    for i in range(frames):
+                        writer.write_frame(sequence.frame_at(i / self.fps))
+                elapsed = time.time() - s.start
+                s.set(encode_fps=round(frames / elapsed, 2) if elapsed else None,
+                      bytes_out=os.path.getsize(output_path), pages_built=sequence.pages_built)
+        finally:
+            sequence.close()
+            os.remove(audio_path)
+
+    def _build_batch(self, batch: dict) -> Tuple[List[Tuple[str, float]], Optional[np.ndarray]]:
+        """
+        Lays out one batch as (image_path, duration) pages and builds its mixed narration/music
+        track. The narration duration is split evenly across the batch's pages.
+        """
+        aud_path = batch['audio_path']
+        items = batch['items']
+        mood = batch.get('mood', 'Neutral')
         
-        fg = fg.with_position(pos_func).with_duration(duration)
-        bg = bg.with_duration(duration)
+        if not os.path.exists(aud_path):
+            print(f"Warning: Skipping batch, missing audio: {aud_path}")
+            return [], None
+
+        # Missing pages are dropped up front so the remaining ones share the whole narration
+        image_paths = [item['image_path'] for item in items if os.path.exists(item['image_path'])]
+        if not image_paths:
+            return [], None
+
+        # --- VOICE + BACKGROUND MUSIC MIXING ---
+        track = self.mixer.mix(aud_path, self._music_file(mood))
+        total_duration = self.mixer.duration(track)
         
-        base = ColorClip(size=self.screen_size, color=(0,0,0), duration=duration)
-        return CompositeVideoClip([base, bg, fg], size=self.screen_size)
+        # Equal distribution of duration
+        clip_duration = total_duration / len(image_paths)
+        return [(img_path, clip_duration) for img_path in image_paths], track
 
 if __name__ == "__main__":
     # Test block
@@ -1,34 +1,283 @@
 import os
 import time
-import json
+import itertools
 import mimetypes
-from typing import List, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Iterator, List, Optional, Tuple
 from google import genai
 from google.genai import types
+from pdf2image import pdfinfo_from_path
 import dotenv
+from cache import file_sha256, text_sha256, load_json, save_json_atomic
+from rate_limiter import RateLimiter, is_rate_limit_error
+from json_stream import JSONArrayStream
+from instrumentation import span, tracer
 
 dotenv.load_dotenv()
 
+# Bump whenever the analysis prompt changes, so cached analyses are not reused
+PROMPT_VERSION = 1
+
+# Files are reused only while they have at least this much life left
+UPLOAD_EXPIRY_MARGIN = timedelta(minutes=30)
+
+MOODS = ["Action", "Suspense", "Sad", "Happy", "Neutral"]
+
+# Chunked analysis: longest "story so far" handed to a window, in characters
+ROLLING_SUMMARY_CHARS = 1500
+
+
+def validate_segment(item, first_page: int, last_page: int) -> Optional[dict]:
+    """
+    Checks one analysis segment against the expected schema: integer pages within
+    first_page..last_page (start <= end), a mood from MOODS and a non-empty script.
+    A segment starting before first_page but running into it (e.g. 3-5 after 1-3, a common
+    model output) is clamped to start at first_page.
+    Returns the normalized segment, or None if it is invalid.
+    """
+    if not isinstance(item, dict):
+        return None
+    try:
+        start_page = int(item.get("start_page"))
+        end_page = int(item.get("end_page", start_page))
+    except (TypeError, ValueError):
+        return None
+    if start_page < first_page <= end_page:
+        start_page = first_page
+    if not first_page <= start_page <= end_page <= last_page:
+        return None
+
+    moods = {m.lower(): m for m in MOODS}
+    mood = moods.get(str(item.get("mood", "")).strip().lower())
+    script = item.get("script")
+    if mood is None or not isinstance(script, str) or not script.strip():
+        return None
+
+    return dict(item, start_page=start_page, end_page=end_page, mood=mood, script=script.strip(),
+                style_instructions=str(item.get("style_instructions") or ""))
+
+
+def _segment_pages_before(item: dict, page: int) -> bool:
+    try:
+        return int(item.get("end_page")) < page
+    except (TypeError, ValueError):
+        return False
+
+
+def plan_windows(page_count: int, window_pages: int, overlap: int) -> List[Tuple[int, int]]:
+    """
+    Splits pages 1..page_count into (start, end) windows of window_pages pages,
+    consecutive windows sharing `overlap` pages.
+    """
+    step = max(1, window_pages - overlap)
+    windows = []
+    start = 1
+    while True:
+        end = min(page_count, start + window_pages - 1)
+        windows.append((start, end))
+        if end >= page_count:
+            return windows
+        start += step
+
+
+def merge_windows(windows: List[Tuple[int, int]], window_segments: List[list], page_count: int) -> list:
+    """
+    Stitches per-window segment lists into one. Each overlap is split at its middle: a segment
+    is kept from the window owning its start page. Page ranges are then made contiguous, from
+    page 1 to page_count, each segment running until the next one starts.
+    """
+    picked = []
+    last = len(windows) - 1
+    for k, ((start, end), segments) in enumerate(zip(windows, window_segments)):
+        low = start if k == 0 else start + (windows[k - 1][1] - start + 1) // 2
+        high = end if k == last else windows[k + 1][0] + (end - windows[k + 1][0] + 1) // 2 - 1
+        picked.extend(seg for seg in segments if low <= seg.get("start_page", low) <= high)
+
+    merged = []
+    for seg in sorted(picked, key=lambda seg: seg.get("start_page", 1)):
+        start_page = 1 if not merged else max(seg.get("start_page", 1), merged[-1]["start_page"] + 1)
+        if start_page > page_count:
+            continue
+        merged.append(dict(seg, start_page=start_page))
+    for seg, next_seg in zip(merged, merged[1:]):
+        seg["end_page"] = next_seg["start_page"] - 1
+    if merged:
+        merged[-1]["end_page"] = page_count
+    return merged
+
 class VisionAgent:
-    def __init__(self, api_key: Optional[str] = None):
+    def __init__(self, api_key: Optional[str] = None, client: Optional[genai.Client] = None,
+                 cache_dir: str = "data/cache/vision", upload_registry: str = "data/cache/gemini_uploads.json",
+                 processing_timeout: float = 300, window_pages: Optional[int] = 40, window_overlap: int = 4,
+                 max_workers: int = 3, requests_per_minute: float = 10,
+                 rate_limiter: Optional[RateLimiter] = None):
         self.api_key = api_key or os.getenv("GEMINI_API_KEY")
-        if not self.api_key:
+        if client is None and not self.api_key:
             raise ValueError("GEMINI_API_KEY must be set in environment or passed to constructor")
         
-        self.client = genai.Client(api_key=self.api_key)
+        self.client = client or genai.Client(api_key=self.api_key)
         # Using gemini-flash-latest as requested
         self.model_id = "gemini-flash-latest" 
+        self.cache_dir = cache_dir
+        # PDFs longer than window_pages are analyzed in overlapping windows (None: always one call)
+        self.window_pages = window_pages
+        self.window_overlap = window_overlap
+        self.max_workers = max_workers
+        self.rate_limiter = rate_limiter or RateLimiter(requests_per_minute)
+        # PDF content hash -> remote file {name, uri, mime_type, expiration_time}
+        self.upload_registry = upload_registry
+        self.processing_timeout = processing_timeout
+        self.registry_lock = threading.Lock()
 
-    def analyze_pdf(self, pdf_path: str, story_context: str = "") -> list:
+    def analysis_key(self, pdf_path: str, story_context: str = "") -> str:
+        return text_sha256(file_sha256(pdf_path), text_sha256(story_context), PROMPT_VERSION, self.model_id,
+                           self.window_pages, self.window_overlap)
+
+    def analysis_path(self, pdf_path: str, story_context: str = "") -> str:
+        """
+        Cache file of the analysis for this PDF and context; it exists once one has completed.
+        """
+        return os.path.join(self.cache_dir, f"{self.analysis_key(pdf_path, story_context)}.json")
+
+    def analyze_pdf(self, pdf_path: str, story_context: str = "", refresh: bool = False,
+                    on_segment: Optional[Callable[[int, dict], None]] = None,
+                    page_count: Optional[int] = None) -> list:
         """
         Analyzes the entire PDF to generate a segmented narrative script.
         Returns a list of segments: [{'pages': [1, 2], 'script': '...', 'style': '...'}]
+
+        Results are cached on disk by PDF content, context, prompt version and model;
+        refresh=True ignores the cached analysis and calls Gemini again.
+
+        on_segment(index, segment) is called for each validated segment as soon as it is
+        final, while the rest of the response is still streaming.
+        page_count is read from the PDF when not given.
         """
-        print(f"Uploading PDF {pdf_path} to Gemini...")
-        file_ref = self._upload_file(pdf_path)
-        
+        started = time.time()
+        cache_path = self.analysis_path(pdf_path, story_context)
+        if not refresh:
+            cached = load_json(cache_path)
+            if cached is not None:
+                print(f"Analysis cache hit for {pdf_path} ({len(cached['segments'])} segments).")
+                if on_segment:
+                    for i, seg in enumerate(cached["segments"]):
+                        on_segment(i, seg)
+                tracer.record("vision.analyze", started, cache_hit=True, segments=len(cached["segments"]))
+                return cached["segments"]
+
+        report = {"complete": True}
+        segments = self._analyze(pdf_path, story_context, on_segment, report, page_count)
+        if report["complete"]:
+            save_json_atomic(cache_path, {"pdf_path": pdf_path, "model_id": self.model_id,
+                                          "prompt_version": PROMPT_VERSION, "segments": segments})
+        tracer.record("vision.analyze", started, cache_hit=False, segments=len(segments),
+                      complete=report["complete"])
+        return segments
+
+    def _analyze(self, pdf_path: str, story_context: str, on_segment, report: dict,
+                 page_count: Optional[int] = None) -> list:
+        file_ref = self._get_file(pdf_path)
+        page_count = page_count or pdfinfo_from_path(pdf_path)["Pages"]
+        if self.window_pages and page_count > self.window_pages:
+            segments = self._analyze_windows(file_ref, page_count, story_context, report)
+            if on_segment:
+                for i, seg in enumerate(segments):
+                    on_segment(i, seg)
+            return segments
+
         print("Analyzing PDF content (this may take a minute)...")
-        
+        segments = []
+        for seg in self._stream_segments(file_ref, story_context, 1, page_count, report, whole_file=True):
+            if on_segment:
+                on_segment(len(segments), seg)
+            segments.append(seg)
+        return segments
+
+    def _analyze_windows(self, file_ref, page_count: int, story_context: str, report: dict) -> list:
+        """
+        Chunked analysis for long volumes: the page range is cut into overlapping windows,
+        each summarized and then scripted concurrently, and the segment lists are stitched.
+        Every window is given the summaries of the windows before it, so the narration
+        carries over without waiting for the previous window's script.
+        """
+        windows = plan_windows(page_count, self.window_pages, self.window_overlap)
+        print(f"Analyzing {page_count} pages in {len(windows)} windows "
+              f"of {self.window_pages} pages (this may take a few minutes)...")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            summaries = list(pool.map(lambda w: self._summarize_window(file_ref, *w), windows))
+            futures = []
+            for k, (start, end) in enumerate(windows):
+                story_so_far = " ".join(summaries[:k])[-ROLLING_SUMMARY_CHARS:]
+                futures.append(pool.submit(
+                    lambda start, end, story_so_far: list(self._stream_segments(
+                        file_ref, story_context, start, end, report, story_so_far=story_so_far)),
+                    start, end, story_so_far))
+            window_segments = [future.result() for future in futures]
+
+        return merge_windows(windows, window_segments, page_count)
+
+    def _stream_segments(self, file_ref, story_context: str, first_page: int, last_page: int, report: dict,
+                         story_so_far: str = "", whole_file: bool = False, max_attempts: int = 3) -> Iterator[dict]:
+        """
+        Streams the analysis of pages first_page..last_page and yields each segment once it
+        has fully arrived and passed validate_segment(). If the response is cut off or a segment
+        is malformed, only the pages after the last good segment are requested again.
+        When attempts run out, the segments obtained so far are kept and report["complete"]
+        is set to False (incomplete analyses are not cached).
+        """
+        next_page = first_page
+        scripts = []
+        for attempt in range(max_attempts):
+            if next_page == first_page:
+                pages = None if whole_file else (first_page, last_page)
+                context = story_so_far
+            else:
+                print(f"Analysis stopped early; requesting pages {next_page}-{last_page} again "
+                      f"(Attempt {attempt + 1}/{max_attempts})")
+                pages = (next_page, last_page)
+                context = " ".join([story_so_far] + scripts)[-ROLLING_SUMMARY_CHARS:]
+
+            parser = JSONArrayStream()
+            complete = False
+            try:
+                for text in self._generate_stream(file_ref, self._build_prompt(story_context, pages, context)):
+                    for item in parser.feed(text):
+                        seg = validate_segment(item, next_page, last_page)
+                        if seg is None:
+                            if isinstance(item, dict) and _segment_pages_before(item, next_page):
+                                continue  # repeats pages already covered
+                            raise ValueError(f"invalid segment after page {next_page - 1}: {str(item)[:200]}")
+                        next_page = seg["end_page"] + 1
+                        scripts.append(seg["script"])
+                        yield seg
+                complete = parser.closed
+            except Exception as e:
+                if is_rate_limit_error(e):
+                    raise e
+                print(f"Error during PDF analysis: {e}")
+
+            if complete or next_page > last_page:
+                return
+
+        if next_page == first_page:
+            raise ValueError(f"No valid segments for pages {first_page}-{last_page} after {max_attempts} attempts")
+        print(f"Warning: pages {next_page}-{last_page} have no narration after {max_attempts} attempts; "
+              f"keeping the {len(scripts)} segments received.")
+        report["complete"] = False
+
+    def _summarize_window(self, file_ref, start: int, end: int) -> str:
+        prompt = f"""
+        Summarize what happens on pages {start} to {end} of this manga (1-based page numbers),
+        in English and in at most 3 sentences: the characters involved and the key events.
+        Return plain text only.
+        """
+        return self._generate(file_ref, prompt, response_mime_type="text/plain", temperature=0.2).strip()
+
+    def _build_prompt(self, story_context: str, pages: Optional[Tuple[int, int]] = None,
+                      story_so_far: str = "") -> str:
         context_block = ""
         if story_context:
             context_block = f"""
@@ -37,9 +286,20 @@ class VisionAgent:
             ---------------------------------------------------
             """
 
+        scope = "Read this entire manga chapter."
+        if pages:
+            scope = (f"Read ONLY pages {pages[0]} to {pages[1]} of this manga volume "
+                     f"(page numbers are 1-based over the whole file). Ignore all other pages.")
+            if story_so_far:
+                context_block += f"""
+            STORY SO FAR (pages before {pages[0]}, for continuity only; do not narrate it again):
+            {story_so_far}
+            ---------------------------------------------------
+            """
+
         prompt_intro = f"""
         You are a professional YouTube Manga Recap scriptwriter targeting an ARABIC-speaking audience. 
-        Read this entire manga chapter. 
+        {scope} 
         
         {context_block}
         
@@ -71,41 +331,149 @@ class VisionAgent:
         ]
         """
         
-        prompt = prompt_intro + json_template
+        return prompt_intro + json_template
 
-        try:
-            response = self.client.models.generate_content(
-                model=self.model_id,
-                contents=[
-                    types.Content(
-                        parts=[
-                            types.Part.from_uri(
-                                file_uri=file_ref.uri,
-                                mime_type=file_ref.mime_type),
-                            types.Part.from_text(text=prompt)
-                        ]
-                    )
-                ],
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json",
-                    temperature=1
+    def _request(self, file_ref, prompt: str, response_mime_type: str, temperature: float) -> dict:
+        return dict(
+            model=self.model_id,
+            contents=[
+                types.Content(
+                    parts=[
+                        types.Part.from_uri(
+                            file_uri=file_ref.uri,
+                            mime_type=file_ref.mime_type),
+                        types.Part.from_text(text=prompt)
+                    ]
                 )
+            ],
+            config=types.GenerateContentConfig(
+                response_mime_type=response_mime_type,
+                temperature=temperature
             )
-            return json.loads(response.text)
+        )
+
+    def _generate(self, file_ref, prompt: str, response_mime_type: str = "application/json",
+                  temperature: float = 1, max_retries: int = 3) -> str:
+        """
+        One rate-limited generate_content call on the uploaded file, retried on quota errors.
+        Returns the response text.
+        """
+        with span("vision.generate", mime_type=response_mime_type, bytes_in=len(prompt)) as s:
+            response = self.rate_limiter.call_with_backoff(
+                lambda: self.client.models.generate_content(
+                    **self._request(file_ref, prompt, response_mime_type, temperature)),
+                "analysis", max_retries, span=s)
+            s.set(bytes_out=len(response.text or ""))
+            return response.text
 
+    def _generate_stream(self, file_ref, prompt: str, max_retries: int = 3) -> Iterator[str]:
+        """
+        Streaming variant of _generate for JSON responses: yields text chunks as they arrive.
+        Quota errors are retried only before the first chunk.
+        """
+        def open_stream():
+            # The request goes out on the first next(), so quota errors surface here, before any text
+            stream = iter(self.client.models.generate_content_stream(
+                **self._request(file_ref, prompt, "application/json", 1)))
+            first = next(stream, None)
+            return itertools.chain([] if first is None else [first], stream)
+
+        with span("vision.generate_stream", bytes_in=len(prompt), bytes_out=0) as s:
+            started = False
+            for chunk in self.rate_limiter.call_with_backoff(open_stream, "analysis", max_retries, span=s):
+                if chunk.text:
+                    if not started:
+                        s.set(first_chunk_s=round(time.time() - s.start, 3))
+                    started = True
+                    s.add("bytes_out", len(chunk.text))
+                    yield chunk.text
+
+    def upload(self, pdf_path: str):
+        """
+        Makes sure the PDF is uploaded (see _get_file), e.g. ahead of analyze_pdf.
+        """
+        return self._get_file(pdf_path)
+
+    def _get_file(self, path: str):
+        with span("vision.upload", pdf=path, bytes_in=0) as s:
+            file_ref, reused = self._find_or_upload(path)
+            s.set(reused=reused, bytes_in=0 if reused else os.path.getsize(path))
+            return file_ref
+
+    def _find_or_upload(self, path: str):
+        """
+        Returns (file, reused): the remote Gemini file for this PDF, reusing a previous upload of
+        the same content while it is still alive (checked with a single files.get) and uploading
+        otherwise.
+        """
+        pdf_hash = file_sha256(path)
+        with self.registry_lock:
+            entry = load_json(self.upload_registry, default={}).get(pdf_hash)
+        file_ref = self._reuse_file(entry) if entry else None
+        if file_ref is not None:
+            print(f"Reusing uploaded file: {file_ref.uri}")
+            return file_ref, True
+        if entry:
+            # Expired, gone, failed or stuck: never offer it again, even if the upload below fails
+            with self.registry_lock:
+                registry = load_json(self.upload_registry, default={})
+                registry.pop(pdf_hash, None)
+                save_json_atomic(self.upload_registry, registry)
+
+        print(f"Uploading PDF {path} to Gemini...")
+        file_ref = self._upload_file(path)
+        expiration = file_ref.expiration_time
+        with self.registry_lock:
+            registry = load_json(self.upload_registry, default={})
+            registry[pdf_hash] = {
+                "name": file_ref.name,
+                "uri": file_ref.uri,
+                "mime_type": file_ref.mime_type,
+                "expiration_time": expiration.isoformat() if expiration else None,
+            }
+            save_json_atomic(self.upload_registry, registry)
+        return file_ref, False
+
+    def _reuse_file(self, entry: dict):
+        if entry.get("expiration_time"):
+            expires_at = datetime.fromisoformat(entry["expiration_time"])
+            if expires_at - UPLOAD_EXPIRY_MARGIN <= datetime.now(timezone.utc):
+                return None
+        try:
+            file_ref = self.client.files.get(name=entry["name"])
         except Exception as e:
-            print(f"Error during PDF analysis: {e}")
-            raise e
+            print(f"Uploaded file {entry['name']} is no longer available: {e}")
+            return None
+        try:
+            return self._wait_until_active(file_ref)
+        except (ValueError, TimeoutError) as e:
+            print(f"Uploaded file {entry['name']} is not usable: {e}")
+            return None
 
     def _upload_file(self, path: str):
         file_ref = self.client.files.upload(file=path)
         print(f"File uploaded: {file_ref.uri}")
-        
-        # Wait for processing if it's large (though usually fast for docs)
+        return self._wait_until_active(file_ref)
+
+    def _wait_until_active(self, file_ref):
+        """
+        Polls a file until Gemini has processed it, starting at 0.5 s and backing off
+        up to 5 s between checks. Raises TimeoutError after processing_timeout seconds.
+        """
+        deadline = time.monotonic() + self.processing_timeout
+        interval = 0.5
+        started = time.time()
+        polls = 0
         while file_ref.state.name == "PROCESSING":
+            if time.monotonic() + interval > deadline:
+                raise TimeoutError(f"File {file_ref.name} still processing after {self.processing_timeout}s")
             print("Processing file...")
-            time.sleep(1)
+            time.sleep(interval)
+            interval = min(interval * 1.5, 5.0)
+            polls += 1
             file_ref = self.client.files.get(name=file_ref.name)
+        if polls:
+            tracer.record("vision.processing", started, polls=polls)
             
         if file_ref.state.name == "FAILED":
             raise ValueError("File processing failed.")
@@ -0,0 +1,93 @@
+import os
+import struct
+
+WAV_HEADER_SIZE = 44
+
+
+def wav_header(data_size: int, sample_rate: int, bits_per_sample: int, num_channels: int = 1) -> bytes:
+    """
+    Canonical 44-byte PCM WAV header for `data_size` bytes of sample data.
+    """
+    bytes_per_sample = bits_per_sample // 8
+    block_align = num_channels * bytes_per_sample
+    byte_rate = sample_rate * block_align
+    chunk_size = 36 + data_size
+
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF",
+        chunk_size,
+        b"WAVE",
+        b"fmt ",
+        16,
+        1,
+        num_channels,
+        sample_rate,
+        byte_rate,
+        block_align,
+        bits_per_sample,
+        b"data",
+        data_size
+    )
+
+
+class StreamingWavWriter:
+    """
+    Writes PCM chunks straight to a WAV file as they arrive.
+    The header is reserved with zero sizes and patched on close(), so memory stays
+    constant and a file left over from a crash is detectable with is_complete_wav().
+
+    write_header=False passes the bytes through untouched, for streams that already
+    carry their own WAV container.
+    """
+
+    def __init__(self, path: str, sample_rate: int = 24000, bits_per_sample: int = 16, num_channels: int = 1,
+                 write_header: bool = True):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.bits_per_sample = bits_per_sample
+        self.num_channels = num_channels
+        self.write_header = write_header
+        self.data_size = 0
+        self.file = open(path, "wb")
+        if write_header:
+            self.file.write(wav_header(0, sample_rate, bits_per_sample, num_channels))
+
+    def write(self, pcm: bytes):
+        self.file.write(pcm)
+        self.data_size += len(pcm)
+
+    def close(self):
+        if self.file.closed:
+            return
+        if self.write_header:
+            self.file.seek(0)
+            self.file.write(wav_header(self.data_size, self.sample_rate, self.bits_per_sample, self.num_channels))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def is_complete_wav(path: str) -> bool:
+    """
+    True if the file is a WAV whose RIFF and data sizes match its length on disk,
+    i.e. it was finalized rather than left behind by an interrupted write.
+    """
+    try:
+        file_size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            header = f.read(WAV_HEADER_SIZE)
+    except OSError:
+        return False
+    if len(header) < WAV_HEADER_SIZE or header[0:4] != b"RIFF" or header[8:12] != b"WAVE":
+        return False
+    riff_size = struct.unpack("<I", header[4:8])[0]
+    if header[36:40] != b"data":
+        # Not our canonical layout (extra chunks); trust the RIFF size alone
+        return riff_size + 8 == file_size
+    data_size = struct.unpack("<I", header[40:44])[0]
+    return riff_size + 8 == file_size and data_size > 0 and data_size + WAV_HEADER_SIZE == file_size
@@ -0,0 +1,15 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Forking a process that runs threads (prefetch, TTS, the segment-render consumer) can copy a lock
+# another thread holds, leaving the child deadlocked. Workers start from a clean forkserver
+# process instead, or a spawned interpreter where forkserver is unavailable (Windows).
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def process_pool(max_workers: int) -> ProcessPoolExecutor:
+    """
+    Process pool safe to create while other threads are running. Worker functions and their
+    arguments must be picklable and importable by module name, as with any process pool.
+    """
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context(START_METHOD))
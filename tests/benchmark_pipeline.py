@@ -0,0 +1,260 @@
+"""
+End-to-end benchmark of the recap pipeline, offline.
+
+Runs RecapPipeline (as main.py does) on pages already rasterized in data/images, with the
+Gemini and Tavily clients replaced by the fakes from src/fake_backend.py, and reports per-stage
+wall time, CPU time (this process, its render workers and their ffmpeg encoders), peak RSS
+and render frames/sec.
+Results are written as JSON; pass a previous result with --compare to print the differences.
+
+    python tests/benchmark_pipeline.py --pages 6 --screen-size 640x360 --warm
+"""
+import os
+import sys
+import json
+import time
+import wave
+import shutil
+import argparse
+import platform
+import tempfile
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from pipeline import RecapPipeline
+from vision_agent import VisionAgent
+from audio_generator import AudioGenerator
+from context_agent import ContextAgent
+from fake_backend import FakeGemini, FakeTavily
+from ffmpeg_tools import ENCODER_PROFILES, DEFAULT_ENCODER_PROFILE
+from video_editor import PREVIEW_FPS
+from instrumentation import process_usage, tracer
+
+IMAGES_DIR = os.path.join(ROOT, "data", "images")
+STAGES = ["extract", "context", "analyze", "tts", "render", "tts_and_render", "preview"]
+
+
+class ImageDirProcessor:
+    """
+    PDFProcessor stand-in that returns pages rendered earlier, so no PDF (or poppler) is needed.
+    """
+
+    def __init__(self, image_paths):
+        self.image_paths = image_paths
+
+    def extract_images(self, pdf_path, screen_size=None, **kwargs):
+        return list(self.image_paths)
+
+
+def chapter_pages(chapter, pages=None):
+    paths = sorted(os.path.join(IMAGES_DIR, name) for name in os.listdir(IMAGES_DIR)
+                   if name.startswith(f"{chapter}_page_") and name.endswith((".jpeg", ".jpg", ".png"))
+                   and "_fg_" not in name and "_bg_" not in name)
+    return paths[:pages] if pages else paths
+
+
+def default_chapter():
+    names = sorted(n for n in os.listdir(IMAGES_DIR) if "_page_" in n)
+    return names[0].split("_page_")[0] if names else None
+
+
+def usage():
+    # Render workers start from the forkserver, not from this process: RUSAGE_CHILDREN never
+    # counts them or their ffmpeg encoders, so their own usage is taken from what they report back
+    own = process_usage()
+    workers = tracer.workers_usage()
+    return {
+        "wall": time.perf_counter(),
+        "cpu": own["cpu_s"] + own["children_cpu_s"] + workers["cpu_s"],
+        "peak_rss_mb": own["maxrss_mb"],
+        "children_peak_rss_mb": max(own["children_maxrss_mb"], workers["maxrss_mb"], workers["children_maxrss_mb"]),
+    }
+
+
+def measure(stages, name, func):
+    def timed(*args, **kwargs):
+        start = usage()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            end = usage()
+            stages[name] = {
+                "wall_s": round(end["wall"] - start["wall"], 3),
+                "cpu_s": round(end["cpu"] - start["cpu"], 3),
+                "peak_rss_mb": round(end["peak_rss_mb"], 1),
+                "children_peak_rss_mb": round(end["children_peak_rss_mb"], 1),
+            }
+    return timed
+
+
+def narration_seconds(batches):
+    total = 0.0
+    for batch in batches:
+        if os.path.exists(batch["audio_path"]):
+            with wave.open(batch["audio_path"], "rb") as f:
+                total += f.getnframes() / f.getframerate()
+    return total
+
+
+def run_once(name, args, work_dir, image_paths):
+    gemini = FakeGemini(page_count=len(image_paths), pages_per_segment=args.pages_per_segment,
+                        words_per_script=args.words_per_script, latency=args.latency,
+                        chunk_latency=args.chunk_latency, rate_limit_every=args.rate_limit_every)
+    tavily = FakeTavily(latency=args.latency, rate_limit_every=args.rate_limit_every)
+    cache_dir = os.path.join(work_dir, "cache")
+
+    # The "PDF" only feeds the run's identity (name and content hash)
+    pdf_path = os.path.join(work_dir, f"{args.chapter}.pdf")
+    with open(pdf_path, "w") as f:
+        f.write("\n".join(os.path.basename(p) for p in image_paths))
+
+    pipeline = RecapPipeline(
+        pdf_path,
+        manifest_dir=os.path.join(work_dir, "runs"),
+        audio_dir=os.path.join(work_dir, "audio"),
+        project_file=os.path.join(work_dir, "recap_project.json"),
+        output_dir=os.path.join(work_dir, "output"),
+        parallel_render=not args.sequential_render,
+        render_workers=args.render_workers,
+        screen_size=args.screen_size,
+        encoder_profile=args.encoder_profile,
+        preview=args.preview or bool(args.preview_segments),
+        preview_segments=args.preview_segments,
+        background_cache_dir=os.path.join(cache_dir, "backgrounds"),
+        pdf_processor=ImageDirProcessor(image_paths),
+        vision_agent=VisionAgent(client=gemini, cache_dir=os.path.join(cache_dir, "vision"),
+                                 upload_registry=os.path.join(cache_dir, "uploads.json"),
+                                 requests_per_minute=args.vision_rpm),
+        audio_gen=AudioGenerator(client=gemini, cache_dir=os.path.join(cache_dir, "tts"),
+                                 requests_per_minute=args.tts_rpm, max_workers=args.tts_workers),
+        context_agent=ContextAgent(client=tavily, cache_dir=os.path.join(cache_dir, "context")),
+        trace_path=f"{os.path.splitext(args.trace)[0]}.{name}.json" if args.trace else None,
+    )
+    stages = {}
+    for stage in STAGES:
+        method = f"_stage_{stage}"
+        setattr(pipeline, method, measure(stages, stage, getattr(pipeline, method)))
+
+    started = time.time()
+    start = usage()
+    final_path = pipeline.run()
+    end = usage()
+    pipeline.audio_gen.close()
+
+    batches = pipeline.batches_data
+    if args.preview_segments:
+        batches = [b for b in batches if b["segment"] in args.preview_segments]
+    seconds = narration_seconds(batches)
+    frames = round(seconds * (PREVIEW_FPS if pipeline.preview else 24))
+    render_stage = stages.get("tts_and_render") or stages.get("render") or stages.get("preview") or {}
+    return {
+        "name": name,
+        "output": final_path,
+        "pages": len(image_paths),
+        "segments": len(pipeline.segments),
+        "video_seconds": round(seconds, 2),
+        "video_bytes": os.path.getsize(final_path) if final_path and os.path.exists(final_path) else None,
+        "frames": frames,
+        "render_fps": round(frames / render_stage["wall_s"], 2) if render_stage.get("wall_s") else None,
+        "stages": stages,
+        "total": {
+            "wall_s": round(end["wall"] - start["wall"], 3),
+            "cpu_s": round(end["cpu"] - start["cpu"], 3),
+            "peak_rss_mb": round(end["peak_rss_mb"], 1),
+            "children_peak_rss_mb": round(end["children_peak_rss_mb"], 1),
+        },
+        "api_calls": {"gemini": dict(gemini.calls), "tavily": dict(tavily.calls)},
+        "spans": tracer.report(since=started)["summary"],
+    }
+
+
+def compare(results, baseline_path):
+    baseline = {run["name"]: run for run in json.load(open(baseline_path))["runs"]}
+    print(f"\n=== Compared with {baseline_path} (wall seconds) ===")
+    for run in results["runs"]:
+        old = baseline.get(run["name"])
+        if not old:
+            continue
+        rows = [(stage, old["stages"].get(stage, {}).get("wall_s"), data["wall_s"])
+                for stage, data in run["stages"].items()]
+        rows.append(("total", old["total"]["wall_s"], run["total"]["wall_s"]))
+        for stage, before, after in rows:
+            if before:
+                print(f"[{run['name']}] {stage:<15} {before:>9.3f} -> {after:>9.3f} ({(after - before) / before:+.1%})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end pipeline benchmark")
+    parser.add_argument("--chapter", default=default_chapter(), help="Image name prefix in data/images")
+    parser.add_argument("--pages", type=int, default=None, help="Only use the first N pages")
+    parser.add_argument("--screen-size", type=lambda s: tuple(int(v) for v in s.split("x")), default=(1920, 1080),
+                        help="Video size, WxH")
+    parser.add_argument("--render-workers", type=int, default=None)
+    parser.add_argument("--encoder-profile", choices=sorted(ENCODER_PROFILES), default=DEFAULT_ENCODER_PROFILE)
+    parser.add_argument("--sequential-render", action="store_true")
+    parser.add_argument("--preview", action="store_true", help="Render the review proxy instead of the final video")
+    parser.add_argument("--preview-segments", type=lambda s: [int(v) for v in s.split(",")], default=None)
+    parser.add_argument("--pages-per-segment", type=int, default=3)
+    parser.add_argument("--words-per-script", type=int, default=40,
+                        help="Script length; the fake TTS speaks 0.35 s per word")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake API latency per request, seconds")
+    parser.add_argument("--chunk-latency", type=float, default=0.0, help="Fake delay between streamed chunks")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Fail every Nth API request with a 429")
+    parser.add_argument("--tts-rpm", type=float, default=10)
+    parser.add_argument("--tts-workers", type=int, default=4)
+    parser.add_argument("--vision-rpm", type=float, default=10)
+    parser.add_argument("--warm", action="store_true", help="Run a second pass on the warm caches")
+    parser.add_argument("--work-dir", default=None, help="Keep run files here (default: a temp dir, removed)")
+    parser.add_argument("--out", default=os.path.join(ROOT, "output", "benchmark.json"))
+    parser.add_argument("--trace", default=None,
+                        help="Write a Chrome trace per run (<trace>.cold.json, <trace>.warm.json)")
+    parser.add_argument("--compare", default=None, help="Previous benchmark JSON to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    image_paths = chapter_pages(args.chapter, args.pages)
+    if not image_paths:
+        print(f"Error: no pages found for {args.chapter} in {IMAGES_DIR}")
+        return 1
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="recap-bench-")
+    os.makedirs(work_dir, exist_ok=True)
+    print(f"Benchmarking {len(image_paths)} pages of {args.chapter} in {work_dir}")
+    try:
+        runs = [run_once("cold", args, work_dir, image_paths)]
+        if args.warm:
+            runs.append(run_once("warm", args, work_dir, image_paths))
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpu_count": os.cpu_count()},
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "work_dir")},
+        "runs": runs,
+    }
+    os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=4)
+
+    print("\n=== Benchmark ===")
+    for run in runs:
+        print(f"[{run['name']}] {run['total']['wall_s']:.2f}s wall, {run['total']['cpu_s']:.2f}s CPU, "
+              f"{run['frames']} frames at {run['render_fps']} fps, {run['video_bytes']} bytes, "
+              f"peak RSS {run['total']['peak_rss_mb']} MB")
+        for stage, data in run["stages"].items():
+            print(f"    {stage:<15} {data['wall_s']:>8.3f}s wall {data['cpu_s']:>8.3f}s CPU")
+    print(f"Results written to {args.out}")
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The modules in src/ import each other by bare name (from cache import ...), as they do when
+# run as scripts from src/; make that resolve for tests too
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
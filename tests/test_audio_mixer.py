@@ -0,0 +1,56 @@
+"""
+AudioMixer: music looped sample-accurately under the narration at music_gain, and decoded
+tracks shared through the .npy cache.
+"""
+import numpy as np
+from audio_mixer import AudioMixer
+
+RATE = 8000
+
+
+def write_wav(mixer, path, samples):
+    return mixer.write_wav(np.asarray(samples, dtype=np.float32).reshape(-1, 1), str(path))
+
+
+def make_mixer(**kwargs):
+    return AudioMixer(sample_rate=RATE, channels=1, music_gain=0.5, **kwargs)
+
+
+def test_music_is_tiled_to_the_voice_length_at_music_gain(tmp_path):
+    mixer = make_mixer()
+    voice = write_wav(mixer, tmp_path / "voice.wav", np.full(RATE, 0.25))
+    music = write_wav(mixer, tmp_path / "music.wav", np.linspace(-0.5, 0.5, 300))
+
+    mixed = mixer.mix(voice, music)
+    assert mixed.shape == (RATE, 1)
+    assert mixer.duration(mixed) == 1.0
+    expected = 0.25 + 0.5 * np.tile(np.linspace(-0.5, 0.5, 300), -(-RATE // 300))[:RATE]
+    assert np.allclose(mixed[:, 0], expected, atol=1e-3)
+
+
+def test_mix_is_clipped_and_music_is_optional(tmp_path):
+    mixer = make_mixer()
+    voice = write_wav(mixer, tmp_path / "voice.wav", np.full(RATE // 2, 0.9))
+    music = write_wav(mixer, tmp_path / "music.wav", np.full(100, 0.9))
+    assert np.allclose(mixer.mix(voice, music), 1.0)
+    assert np.allclose(mixer.mix(voice), 0.9, atol=1e-3)
+    # An unreadable track leaves the narration alone
+    (tmp_path / "broken.mp3").write_text("not audio")
+    assert np.allclose(mixer.mix(voice, str(tmp_path / "broken.mp3")), 0.9, atol=1e-3)
+
+
+def test_decoded_tracks_are_shared_through_the_cache(tmp_path, monkeypatch):
+    music = write_wav(make_mixer(), tmp_path / "music.wav", np.linspace(-0.5, 0.5, 300))
+    decoded = []
+    original = AudioMixer._decode
+
+    def counting_decode(self, path):
+        decoded.append(path)
+        return original(self, path)
+
+    monkeypatch.setattr(AudioMixer, "_decode", counting_decode)
+    first = make_mixer(cache_dir=str(tmp_path / "music_cache")).load_track(music)
+    # Another mixer (e.g. a render worker) memory-maps the stored track
+    second = make_mixer(cache_dir=str(tmp_path / "music_cache")).load_track(music)
+    assert decoded == [music]
+    assert isinstance(second, np.memmap) and np.array_equal(first, second)
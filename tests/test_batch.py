@@ -0,0 +1,40 @@
+"""
+load_pdf_list: batch sources from a directory, a JSON manifest or a CSV manifest.
+"""
+import os
+import json
+import pytest
+from batch import load_pdf_list
+
+
+def test_directory_lists_its_pdfs_sorted(tmp_path):
+    for name in ["ch_02.pdf", "ch_01.PDF", "notes.txt"]:
+        (tmp_path / name).write_bytes(b"")
+    assert load_pdf_list(str(tmp_path)) == [str(tmp_path / "ch_01.PDF"), str(tmp_path / "ch_02.pdf")]
+
+
+@pytest.mark.parametrize("data", [
+    ["ch_01.pdf", "/abs/ch_02.pdf"],
+    {"pdfs": ["ch_01.pdf", "/abs/ch_02.pdf"]},
+    [{"pdf_path": "ch_01.pdf"}, {"pdf_path": "/abs/ch_02.pdf"}],
+])
+def test_json_manifest_paths_are_relative_to_it(tmp_path, data):
+    os.makedirs(tmp_path / "lists")
+    manifest = tmp_path / "lists" / "chapters.json"
+    manifest.write_text(json.dumps(data))
+    assert load_pdf_list(str(manifest)) == [str(tmp_path / "lists" / "ch_01.pdf"), "/abs/ch_02.pdf"]
+
+
+def test_csv_manifest_uses_the_pdf_path_column(tmp_path):
+    manifest = tmp_path / "chapters.csv"
+    manifest.write_text("title,pdf_path\nOne,ch_01.pdf\nBlank, \nTwo,/abs/ch_02.pdf\n")
+    assert load_pdf_list(str(manifest)) == [str(tmp_path / "ch_01.pdf"), "/abs/ch_02.pdf"]
+
+    # Without a header, the first column
+    manifest.write_text("ch_01.pdf,One\n/abs/ch_02.pdf,Two\n")
+    assert load_pdf_list(str(manifest)) == [str(tmp_path / "ch_01.pdf"), "/abs/ch_02.pdf"]
+
+
+def test_unsupported_source(tmp_path):
+    with pytest.raises(ValueError, match="Unsupported batch source"):
+        load_pdf_list(str(tmp_path / "chapters.txt"))
@@ -0,0 +1,49 @@
+"""
+BlobCache: size-bounded, least recently used files are evicted first.
+"""
+import os
+import time
+from cache import BlobCache
+
+
+def make_cache(tmp_path, max_bytes, keys):
+    cache = BlobCache(str(tmp_path / "blobs"), max_bytes=len(keys) * 100, suffix=".bin")
+    # Oldest first, with mtimes far enough apart to order reliably
+    now = time.time()
+    for age, key in zip(range(len(keys), 0, -1), keys):
+        cache.store_bytes(key, b"x" * 100)
+        os.utime(cache.path_for(key), (now - age * 10, now - age * 10))
+    cache.max_bytes = max_bytes
+    return cache
+
+
+def cached_keys(cache):
+    return sorted(name[:-len(cache.suffix)] for name in os.listdir(cache.cache_dir))
+
+
+def test_store_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, 300, ["a", "b", "c"])
+    cache.store_bytes("d", b"x" * 100)
+    assert cached_keys(cache) == ["b", "c", "d"]
+
+
+def test_fetch_and_touch_count_as_use(tmp_path):
+    cache = make_cache(tmp_path, 300, ["a", "b", "c"])
+    assert cache.fetch("a", str(tmp_path / "a.out"))
+    assert cache.touch("b")
+    cache.store_bytes("d", b"x" * 100)
+    assert cached_keys(cache) == ["a", "b", "d"]
+    assert (tmp_path / "a.out").read_bytes() == b"x" * 100
+
+
+def test_misses(tmp_path):
+    cache = make_cache(tmp_path, 300, [])
+    assert not cache.fetch("missing", str(tmp_path / "out"))
+    assert not cache.touch("missing")
+    assert not (tmp_path / "out").exists()
+
+
+def test_trim_spares_kept_keys_but_counts_them(tmp_path):
+    cache = make_cache(tmp_path, 250, ["a", "b", "c", "d"])
+    cache.trim(keep=["a"])
+    assert cached_keys(cache) == ["a", "d"]
@@ -0,0 +1,86 @@
+"""
+ContextAgent's on-disk cache: hits within the TTL, shorter TTL for empty results, failures
+not cached. The Tavily client is fake_backend.FakeTavily.
+"""
+import os
+import json
+from fake_backend import FakeTavily
+from context_agent import ContextAgent, CONTEXT_TTL, EMPTY_CONTEXT_TTL
+
+
+class EmptyTavily(FakeTavily):
+    def search(self, query, **kwargs):
+        self._request("search")
+        return {"query": query, "answer": None, "results": []}
+
+
+class FailingTavily(FakeTavily):
+    def search(self, query, **kwargs):
+        self._request("search")
+        raise ConnectionError("offline")
+
+
+def make_agent(client, tmp_path):
+    return ContextAgent(client=client, cache_dir=str(tmp_path / "context"))
+
+
+def age_entries(tmp_path, seconds):
+    for path in (tmp_path / "context").glob("*.json"):
+        entry = json.loads(path.read_text())
+        entry["created_at"] -= seconds
+        path.write_text(json.dumps(entry))
+
+
+def test_results_are_cached_until_the_ttl(tmp_path):
+    tavily = FakeTavily()
+    agent = make_agent(tavily, tmp_path)
+    context = agent.get_context("Boruto Chapter 28 summary")
+    assert "Offline summary" in context
+
+    # Same query up to case and spacing
+    assert agent.get_context("  boruto chapter 28   SUMMARY") == context
+    age_entries(tmp_path, CONTEXT_TTL - 60)
+    assert agent.get_context("Boruto Chapter 28 summary") == context
+    assert tavily.calls["search"] == 1
+
+    age_entries(tmp_path, 120)
+    assert agent.get_context("Boruto Chapter 28 summary") == context
+    assert tavily.calls["search"] == 2
+
+
+def test_search_parameters_are_part_of_the_key(tmp_path):
+    tavily = FakeTavily()
+    agent = make_agent(tavily, tmp_path)
+    agent.get_context("query")
+    agent.get_context("query", max_results=5)
+    assert tavily.calls["search"] == 2
+
+
+def test_empty_results_expire_sooner(tmp_path):
+    tavily = EmptyTavily()
+    agent = make_agent(tavily, tmp_path)
+    assert agent.get_context("unknown manga") == ""
+    assert agent.get_context("unknown manga") == ""
+    assert tavily.calls["search"] == 1
+
+    age_entries(tmp_path, EMPTY_CONTEXT_TTL + 60)
+    agent.get_context("unknown manga")
+    assert tavily.calls["search"] == 2
+
+
+def test_failed_searches_are_not_cached(tmp_path):
+    tavily = FailingTavily()
+    agent = make_agent(tavily, tmp_path)
+    assert agent.get_context("query") == ""
+    assert agent.get_context("query") == ""
+    assert tavily.calls["search"] == 2
+    assert not list((tmp_path / "context").glob("*.json"))
+
+
+def test_cache_hits_count_as_use_for_eviction(tmp_path):
+    agent = make_agent(FakeTavily(), tmp_path)
+    agent.get_context("query")
+    (path,) = (tmp_path / "context").glob("*.json")
+    os.utime(path, (0, 0))
+    agent.get_context("query")
+    assert path.stat().st_mtime > 0
@@ -0,0 +1,47 @@
+"""
+FFmpegFrameWriter: raw frames piped to ffmpeg with the settings of each encoder profile.
+"""
+import numpy as np
+import pytest
+from ffmpeg_tools import ENCODER_PROFILES, FFmpegFrameWriter, encoder_profile
+
+SIZE = (64, 48)
+
+
+def encode(path, profile, frames=30, **kwargs):
+    frame = np.zeros((SIZE[1], SIZE[0], 3), dtype=np.uint8)
+    with FFmpegFrameWriter(str(path), SIZE, 24, profile, **kwargs) as writer:
+        for n in range(frames):
+            frame[:, :, 0] = n * 8
+            writer.write_frame(frame)
+    return writer
+
+
+@pytest.mark.parametrize("profile", sorted(ENCODER_PROFILES))
+def test_profiles_reach_the_encoder(tmp_path, profile):
+    path = tmp_path / f"{profile}.mp4"
+    assert encode(path, profile).frames == 30
+
+    # x264 records the options it encoded with in the stream
+    options = path.read_bytes()
+    settings = ENCODER_PROFILES[profile]
+    assert f"crf={settings['crf']:.1f}".encode() in options
+    if settings["gop"]:
+        assert f"keyint={settings['gop']}".encode() in options
+
+
+def test_unknown_profile():
+    with pytest.raises(ValueError, match="Unknown encoder profile 'fast'"):
+        encoder_profile("fast")
+
+
+def test_frames_must_match_the_size(tmp_path):
+    with pytest.raises(ValueError, match="Expected a contiguous 48x64x3 uint8 frame"):
+        with FFmpegFrameWriter(str(tmp_path / "out.mp4"), SIZE, 24, "draft") as writer:
+            writer.write_frame(np.zeros((SIZE[1], SIZE[0] // 2, 3), dtype=np.uint8))
+    assert writer.process.returncode is not None
+
+
+def test_encoder_errors_are_raised(tmp_path):
+    with pytest.raises(RuntimeError, match="ffmpeg encode failed"):
+        encode(tmp_path / "out.mp4", "draft", audio_path=str(tmp_path / "missing.wav"))
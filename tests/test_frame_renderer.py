@@ -0,0 +1,69 @@
+"""
+CinematicRenderer's blurred background: computed once per page and look, then served from
+the background cache.
+"""
+import numpy as np
+import pytest
+from PIL import Image
+import frame_renderer
+from frame_renderer import CinematicRenderer, blur_background
+from cache import BlobCache
+
+SCREEN_SIZE = (160, 90)
+
+
+@pytest.fixture
+def blurs(monkeypatch):
+    """
+    Counts blur_background calls.
+    """
+    calls = []
+
+    def counting_blur(*args, **kwargs):
+        calls.append(1)
+        return blur_background(*args, **kwargs)
+
+    monkeypatch.setattr(frame_renderer, "blur_background", counting_blur)
+    return calls
+
+
+def make_page(tmp_path):
+    # Checkerboard, so a blur is visible
+    tiles = (np.indices((90, 60)).sum(axis=0) // 5 % 2 * 255).astype(np.uint8)
+    path = str(tmp_path / "page_001.png")
+    Image.fromarray(np.stack([tiles] * 3, axis=-1)).save(path)
+    return path
+
+
+def render(page, cache, **kwargs):
+    return CinematicRenderer(page, 1.0, SCREEN_SIZE, background_cache=cache, **kwargs).background
+
+
+def test_background_is_blurred_and_darkened():
+    tiles = (np.indices((90, 160)).sum(axis=0) // 5 % 2 * 255).astype(np.uint8)
+    background = blur_background(np.stack([tiles] * 3, axis=-1), radius=8, opacity=0.5)
+    assert background.shape == (90, 160, 3) and background.dtype == np.uint8
+    assert background.max() <= 128 and background.std() < tiles.std() / 4
+
+
+def test_background_is_cached_per_page_and_look(tmp_path, blurs):
+    page = make_page(tmp_path)
+    cache = BlobCache(str(tmp_path / "backgrounds"), max_bytes=10 ** 8, suffix=".png")
+    first = render(page, cache)
+    assert np.array_equal(render(page, cache), first)
+    assert len(blurs) == 1
+
+    # Another look is another entry
+    render(page, cache, background_opacity=0.6)
+    render(page, cache, draft=True)
+    assert len(blurs) == 3
+
+
+def test_unreadable_cached_background_is_recomputed(tmp_path, blurs):
+    page = make_page(tmp_path)
+    cache = BlobCache(str(tmp_path / "backgrounds"), max_bytes=10 ** 8, suffix=".png")
+    first = render(page, cache)
+    (path,) = (tmp_path / "backgrounds").glob("*.png")
+    path.write_bytes(b"truncated")
+    assert np.array_equal(render(page, cache), first)
+    assert len(blurs) == 2
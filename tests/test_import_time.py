@@ -0,0 +1,71 @@
+"""
+Import-time budget for the command-line entry points.
+
+Each module is imported in a fresh interpreter; its cost is the wall time above a bare
+interpreter start (best of a few runs). Heavy dependencies (moviepy, google-genai, tavily,
+pdf2image, numpy, PIL) must only load in the stage that needs them.
+
+    python -m pytest tests/test_import_time.py
+    python tests/test_import_time.py      # prints the timings
+"""
+import os
+import sys
+import time
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+
+# Seconds above interpreter startup
+BUDGETS = {"main": 0.5, "batch": 0.5, "pipeline": 0.5, "assemble": 0.2}
+HEAVY_MODULES = ["moviepy", "google.genai", "tavily", "pdf2image", "numpy", "PIL"]
+RUNS = 3
+
+
+def run_python(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, "-c", code], cwd=SRC, capture_output=True, text=True, check=True)
+
+
+def startup_seconds(code: str) -> float:
+    best = None
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        run_python(code)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def import_seconds(module: str) -> float:
+    return max(0.0, startup_seconds(f"import {module}") - startup_seconds("pass"))
+
+
+def loaded_heavy_modules(module: str) -> list:
+    code = f"import sys, {module}; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    return [m for m in run_python(code).stdout.strip().split(",") if m]
+
+
+def test_entry_points_defer_heavy_dependencies():
+    for module in BUDGETS:
+        assert loaded_heavy_modules(module) == [], f"importing {module} loads heavy dependencies"
+
+
+def test_entry_points_import_within_budget():
+    for module, budget in BUDGETS.items():
+        seconds = import_seconds(module)
+        assert seconds < budget, f"import {module} took {seconds:.3f}s (budget {budget}s)"
+
+
+def test_main_help_is_fast():
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "main.py", "--help"], cwd=SRC, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    assert result.returncode == 0 and "--resume" in result.stdout
+    assert elapsed < 1.0, f"main.py --help took {elapsed:.3f}s"
+
+
+if __name__ == "__main__":
+    for module, budget in BUDGETS.items():
+        heavy = loaded_heavy_modules(module)
+        print(f"{module:<10} {import_seconds(module):.3f}s (budget {budget}s)"
+              + (f"  loads {', '.join(heavy)}" if heavy else ""))
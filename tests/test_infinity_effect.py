@@ -1,8 +1,12 @@
 import os
+import sys
 import math
 import numpy as np
 from moviepy import ImageClip, concatenate_videoclips, CompositeVideoClip, ColorClip
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+from frame_renderer import blur_background, BACKGROUND_BLUR, BACKGROUND_OPACITY
+
 # Parameters
 OUTPUT_FILE = "output/test_infinity_effect.mp4"
 IMAGES_DIR = "data/images"
@@ -61,10 +65,9 @@ def create_infinity_clip(image_path, duration):
     
     bg = bg.cropped(x1=x1, y1=y1, width=screen_w, height=screen_h)
 
-    # Blur effect (simulated by darkening for speed/compatibility if blur is heavy, 
-    # but let's try a simple opacity or layout trick). 
-    # MoviePy Blur can be slow. A common trick is just darkening it significantly.
-    bg = bg.with_opacity(0.3) # Darken background to make foreground pop
+    # Blur effect: MoviePy blur is far too slow per frame, but the background is static,
+    # so it is blurred once as a still image, with the renderer's own blur and darkening
+    bg = ImageClip(blur_background(bg.get_frame(0).astype("uint8"), BACKGROUND_BLUR * screen_h, BACKGROUND_OPACITY))
     
     # --- FOREGROUND (Main Image, Fit Height + Infinity Move) ---
     # We use "min" ratio to ensure the image fits in the screen
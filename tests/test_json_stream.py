@@ -0,0 +1,48 @@
+"""
+JSONArrayStream: objects come out as soon as their closing brace arrives, whatever the chunking.
+"""
+import json
+from json_stream import JSONArrayStream
+
+SEGMENTS = [
+    {"start_page": 1, "end_page": 2, "script": "He said \"wait {here}\" and left.", "mood": "Sad"},
+    {"start_page": 3, "end_page": 3, "script": "Back\\slash [brackets] too", "mood": "Action"},
+]
+
+
+def feed_all(parser, text, chunk_size):
+    items = []
+    for i in range(0, len(text), chunk_size):
+        items.extend(parser.feed(text[i:i + chunk_size]))
+    return items
+
+
+def test_objects_parse_across_any_chunking():
+    text = "```json\n" + json.dumps(SEGMENTS, indent=2) + "\n```"
+    for chunk_size in (1, 7, len(text)):
+        parser = JSONArrayStream()
+        assert feed_all(parser, text, chunk_size) == SEGMENTS
+        assert parser.closed
+
+
+def test_object_is_returned_once_complete():
+    parser = JSONArrayStream()
+    text = json.dumps(SEGMENTS)
+    cut = len(json.dumps(SEGMENTS[0])) + 1
+    assert parser.feed(text[:cut - 1]) == []
+    assert parser.feed(text[cut - 1:cut]) == [SEGMENTS[0]]
+    assert not parser.closed
+
+
+def test_malformed_object_yields_none_and_parsing_continues():
+    parser = JSONArrayStream()
+    items = parser.feed('[{"start_page": 1, oops}, {"start_page": 2}]')
+    assert items == [None, {"start_page": 2}]
+    assert parser.closed
+
+
+def test_truncated_response_is_not_closed():
+    parser = JSONArrayStream()
+    text = json.dumps(SEGMENTS)
+    assert parser.feed(text[:-10]) == [SEGMENTS[0]]
+    assert not parser.closed
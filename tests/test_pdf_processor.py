@@ -0,0 +1,75 @@
+"""
+PDFProcessor's page cache: pages rendered from the same PDF with the same settings are reused,
+only stale pages are rendered again. poppler is replaced by a fake rasterizer, and the process
+pool by threads so the fake applies in the workers.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from PIL import Image
+import pdf_processor
+from pdf_processor import PDFProcessor
+
+PAGES = 5
+
+
+@pytest.fixture
+def rendered(monkeypatch):
+    """
+    Page numbers rasterized by the fake poppler, in call order.
+    """
+    pages = []
+
+    def convert_from_path(pdf_path, dpi, first_page, last_page):
+        pages.extend(range(first_page, last_page + 1))
+        return [Image.new("RGB", (60, 90), (40 * n, 80, 160)) for n in range(first_page, last_page + 1)]
+
+    monkeypatch.setattr(pdf_processor, "convert_from_path", convert_from_path)
+    monkeypatch.setattr(pdf_processor, "pdfinfo_from_path", lambda pdf_path, **kwargs: {"Pages": PAGES})
+    monkeypatch.setattr(pdf_processor, "process_pool", lambda max_workers: ThreadPoolExecutor(max_workers))
+    return pages
+
+
+def make_pdf(tmp_path, content=b"%PDF offline stand-in"):
+    path = tmp_path / "chapter.pdf"
+    path.write_bytes(content)
+    return str(path)
+
+
+def make_processor(tmp_path):
+    return PDFProcessor(output_dir=str(tmp_path / "images"), workers=2, pages_per_task=2)
+
+
+def test_second_extract_is_a_page_cache_hit(tmp_path, rendered):
+    pdf_path = make_pdf(tmp_path)
+    paths = make_processor(tmp_path).extract_images(pdf_path)
+    assert [os.path.basename(p) for p in paths] == [f"chapter_page_{n:03d}.jpeg" for n in range(1, PAGES + 1)]
+    assert sorted(rendered) == list(range(1, PAGES + 1))
+
+    rendered.clear()
+    assert make_processor(tmp_path).extract_images(pdf_path) == paths
+    assert rendered == []
+
+
+def test_only_stale_pages_are_rendered_again(tmp_path, rendered):
+    pdf_path = make_pdf(tmp_path)
+    paths = make_processor(tmp_path).extract_images(pdf_path)
+
+    # A page overwritten since (e.g. by another PDF of the same name) is not the cached one
+    Image.new("RGB", (10, 10)).save(paths[2])
+    os.remove(paths[3])
+    rendered.clear()
+    assert make_processor(tmp_path).extract_images(pdf_path) == paths
+    assert rendered == [3, 4]
+
+    # Other settings render every page
+    rendered.clear()
+    make_processor(tmp_path).extract_images(pdf_path, quality=90)
+    assert sorted(rendered) == list(range(1, PAGES + 1))
+
+
+def test_changed_pdf_content_is_not_served_from_the_cache(tmp_path, rendered):
+    make_processor(tmp_path).extract_images(make_pdf(tmp_path))
+    rendered.clear()
+    make_processor(tmp_path).extract_images(make_pdf(tmp_path, b"%PDF another chapter"))
+    assert sorted(rendered) == list(range(1, PAGES + 1))
@@ -0,0 +1,228 @@
+"""
+RunManifest persistence, --resume of finished stages and TTS segments, and render failures,
+offline with fake_backend's Gemini and Tavily clients.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from fake_backend import FakeGemini, FakeTavily
+from pipeline import RecapPipeline, RunManifest
+from vision_agent import VisionAgent
+from audio_generator import AudioGenerator
+from context_agent import ContextAgent
+
+PAGES = 9
+
+
+class PageListProcessor:
+    """
+    PDFProcessor stand-in returning fixed page paths; the pages are never opened before render.
+    """
+
+    def __init__(self, image_paths):
+        self.image_paths = image_paths
+
+    def extract_images(self, pdf_path, screen_size=None, **kwargs):
+        return list(self.image_paths)
+
+
+def test_manifest_round_trip(tmp_path):
+    path = str(tmp_path / "runs" / "chapter.json")
+    manifest = RunManifest(path)
+    manifest.update("extract", status="done", inputs="abc", outputs={"image_paths": ["p1"]})
+    manifest.update("tts", status="running")
+
+    reloaded = RunManifest(path)
+    assert reloaded.is_done("extract", "abc")
+    assert not reloaded.is_done("extract", "changed inputs")
+    assert not reloaded.is_done("tts", None)
+    assert reloaded.get("extract")["outputs"] == {"image_paths": ["p1"]}
+    assert reloaded.get("render") is None
+
+
+def make_pipeline(tmp_path, resume=False, image_paths=None, **kwargs):
+    """
+    Pipeline over a fake PDF of PAGES pages; returns it with its fake Gemini.
+    """
+    pdf_path = tmp_path / "chapter.pdf"
+    if not pdf_path.exists():
+        pdf_path.write_bytes(b"%PDF offline stand-in")
+    gemini = FakeGemini(page_count=PAGES, pages_per_segment=3, words_per_script=8)
+    cache_dir = tmp_path / "cache"
+    pipeline = RecapPipeline(
+        str(pdf_path), resume=resume,
+        manifest_dir=str(tmp_path / "runs"),
+        audio_dir=str(tmp_path / "audio"),
+        project_file=str(tmp_path / "recap_project.json"),
+        output_dir=str(tmp_path / "output"),
+        background_cache_dir=str(cache_dir / "backgrounds"),
+        pdf_processor=PageListProcessor(image_paths or [f"page_{n:03d}.jpeg" for n in range(1, PAGES + 1)]),
+        vision_agent=VisionAgent(client=gemini, cache_dir=str(cache_dir / "vision"),
+                                 upload_registry=str(cache_dir / "uploads.json"), requests_per_minute=60000),
+        # No TTS cache, so every synthesized segment is an API call
+        audio_gen=AudioGenerator(client=gemini, cache_dir=None, requests_per_minute=60000),
+        context_agent=ContextAgent(client=FakeTavily(), cache_dir=str(cache_dir / "context")),
+        **kwargs,
+    )
+    return pipeline, gemini
+
+
+def run_until_tts(tmp_path, resume):
+    """
+    Runs extract, context, analyze and tts like RecapPipeline.run(); returns the pipeline and its fake Gemini.
+    """
+    pipeline, gemini = make_pipeline(tmp_path, resume)
+    try:
+        pipeline._stage_extract()
+        pipeline._stage_context()
+        pipeline._stage_analyze()
+        pipeline._stage_tts()
+    finally:
+        pipeline.audio_gen.close()
+    return pipeline, gemini
+
+
+def page_images(tmp_path, corrupt=()):
+    """
+    Small page images; the pages numbered in `corrupt` are not images at all.
+    """
+    os.makedirs(tmp_path / "pages", exist_ok=True)
+    paths = []
+    for n in range(1, PAGES + 1):
+        path = str(tmp_path / "pages" / f"page_{n:03d}.jpeg")
+        if n in corrupt:
+            with open(path, "w") as f:
+                f.write("not an image")
+        else:
+            Image.new("RGB", (60, 90), (20 * n, 80, 160)).save(path)
+        paths.append(path)
+    return paths
+
+
+def run_with_timeout(pipeline, seconds=120):
+    """
+    Runs the whole pipeline in a thread; fails the test instead of hanging if it never returns.
+    """
+    result = {}
+
+    def target():
+        try:
+            result["final_path"] = pipeline.run()
+        except Exception as e:
+            result["error"] = e
+        finally:
+            pipeline.audio_gen.close()
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(seconds)
+    assert not thread.is_alive(), "pipeline.run() did not return"
+    return result
+
+
+def tts_calls(gemini):
+    # Analysis and TTS both stream; analysis is one call per uncached run
+    return gemini.calls["generate_content_stream"]
+
+
+def test_resume_skips_finished_tts_segments(tmp_path):
+    pipeline, gemini = run_until_tts(tmp_path, resume=False)
+    assert len(pipeline.batches_data) == 3
+    assert tts_calls(gemini) == 1 + 3
+    assert pipeline.manifest.get("tts")["status"] == "done"
+
+    pipeline, gemini = run_until_tts(tmp_path, resume=True)
+    assert len(pipeline.batches_data) == 3
+    assert tts_calls(gemini) == 0
+
+    # A segment interrupted mid-write (header not finalized) is the only one synthesized again
+    audio_path = pipeline.batches_data[1]["audio_path"]
+    with open(audio_path, "r+b") as f:
+        f.truncate(os.path.getsize(audio_path) - 100)
+    pipeline, gemini = run_until_tts(tmp_path, resume=True)
+    assert tts_calls(gemini) == 1
+    assert pipeline.manifest.get("tts")["status"] == "done"
+
+
+def test_without_resume_every_segment_is_synthesized_again(tmp_path):
+    run_until_tts(tmp_path, resume=False)
+    _, gemini = run_until_tts(tmp_path, resume=False)
+    # The analysis comes from the vision cache; only the narration is redone
+    assert tts_calls(gemini) == 3
+
+
+def test_failed_segment_fails_the_overlapped_render(tmp_path):
+    # Page 5 is in the second of three segments
+    pipeline, _ = make_pipeline(tmp_path, image_paths=page_images(tmp_path, corrupt={5}),
+                                screen_size=(160, 90), render_workers=1)
+    result = run_with_timeout(pipeline)
+
+    assert "segment(s) failed to render (2)" in str(result.get("error"))
+    assert pipeline.manifest.get("render")["status"] == "failed"
+    assert not os.path.exists(tmp_path / "output" / "chapter_recap.mp4")
+    # The other segments are kept for a re-run
+    assert len(os.listdir(tmp_path / "output" / "segments")) == 2
+
+
+def test_failed_stitch_fails_the_overlapped_render(tmp_path, monkeypatch):
+    import video_editor
+
+    def broken_concat(paths, output_path):
+        raise RuntimeError("concat failed")
+
+    monkeypatch.setattr(video_editor, "concat_videos", broken_concat)
+    pipeline, _ = make_pipeline(tmp_path, image_paths=page_images(tmp_path),
+                                screen_size=(160, 90), render_workers=1)
+    result = run_with_timeout(pipeline)
+
+    assert str(result.get("error")) == "concat failed"
+    assert pipeline.manifest.get("render")["status"] == "failed"
+
+
+def test_resume_reuses_the_finished_video(tmp_path, monkeypatch):
+    import video_editor
+    pipeline, _ = make_pipeline(tmp_path, image_paths=page_images(tmp_path),
+                                screen_size=(160, 90), render_workers=1)
+    final_path = run_with_timeout(pipeline)["final_path"]
+    assert os.path.exists(final_path)
+    inputs = pipeline.manifest.get("render")["inputs"]
+
+    def no_render(*args, **kwargs):
+        raise AssertionError("a resumed run rendered the unchanged video again")
+
+    monkeypatch.setattr(video_editor.VideoEditor, "create_video_as_ready", no_render)
+    pipeline, gemini = make_pipeline(tmp_path, resume=True, image_paths=page_images(tmp_path),
+                                     screen_size=(160, 90), render_workers=1)
+    result = run_with_timeout(pipeline)
+    assert result == {"final_path": final_path}
+    assert tts_calls(gemini) == 0
+
+    # Another encoder profile changes the render inputs
+    monkeypatch.undo()
+    pipeline, _ = make_pipeline(tmp_path, resume=True, image_paths=page_images(tmp_path),
+                                screen_size=(160, 90), render_workers=1, encoder_profile="draft")
+    assert run_with_timeout(pipeline)["final_path"] == final_path
+    assert pipeline.manifest.get("render")["status"] == "done"
+    assert pipeline.manifest.get("render")["inputs"] != inputs
+
+
+def prefetch_upload(pipeline):
+    # As in RecapPipeline.run(): the upload prefetch runs beside the context lookup
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        context = pool.submit(pipeline._stage_context)
+        pool.submit(pipeline._prefetch_upload, context).result()
+
+
+def test_upload_prefetch_is_skipped_on_an_analysis_cache_hit(tmp_path):
+    pipeline, gemini = make_pipeline(tmp_path)
+    prefetch_upload(pipeline)
+    assert gemini.calls["upload"] == 1
+    pipeline._stage_extract()
+    pipeline._stage_analyze()
+    pipeline.audio_gen.close()
+
+    # Not resumed, but the analysis is cached: nothing to upload or check
+    pipeline, gemini = make_pipeline(tmp_path)
+    prefetch_upload(pipeline)
+    assert gemini.calls["total"] == 0
@@ -0,0 +1,82 @@
+"""
+RateLimiter pacing, backoff_delay bounds and rate-limit error detection.
+"""
+import time
+import threading
+import pytest
+from rate_limiter import RateLimiter, backoff_delay, is_rate_limit_error
+
+
+def test_burst_is_immediate_then_requests_are_paced():
+    limiter = RateLimiter(requests_per_minute=600, burst=2)  # one token per 0.1s
+    start = time.monotonic()
+    assert limiter.acquire() == 0
+    assert limiter.acquire() == 0
+    waited = limiter.acquire()
+    assert 0.05 < waited <= 0.11
+    assert time.monotonic() - start >= 0.09
+
+
+def test_shared_limiter_paces_all_threads():
+    limiter = RateLimiter(requests_per_minute=1200)  # one token per 0.05s
+    start = time.monotonic()
+    threads = [threading.Thread(target=limiter.acquire) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # The first is immediate, the other four wait their turn
+    assert time.monotonic() - start >= 0.19
+
+
+def test_rate_must_be_positive():
+    with pytest.raises(ValueError):
+        RateLimiter(requests_per_minute=0)
+
+
+def test_backoff_delay_is_jittered_within_the_cap():
+    for attempt in range(8):
+        delay = min(60.0, 2.0 * 2 ** attempt)
+        assert all(delay / 2 <= backoff_delay(attempt) <= delay for _ in range(20))
+
+
+def test_rate_limit_errors_are_recognized():
+    assert is_rate_limit_error(Exception("429 Too Many Requests"))
+    assert is_rate_limit_error(Exception("RESOURCE_EXHAUSTED: quota"))
+    assert not is_rate_limit_error(Exception("500 INTERNAL"))
+
+
+def flaky(errors):
+    """
+    A call that raises each of `errors` in turn, then returns "ok"; counts its calls.
+    """
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return "ok"
+    return fn, calls
+
+
+def test_call_with_backoff_retries_quota_errors(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    limiter = RateLimiter(requests_per_minute=60000)
+    fn, calls = flaky([Exception("429 RESOURCE_EXHAUSTED")] * 2)
+    assert limiter.call_with_backoff(fn, "test", max_retries=3) == "ok"
+    assert len(calls) == 3
+
+    # The last quota error is raised once the attempts are used up
+    fn, calls = flaky([Exception("429 RESOURCE_EXHAUSTED")] * 3)
+    with pytest.raises(Exception, match="429"):
+        limiter.call_with_backoff(fn, "test", max_retries=3)
+    assert len(calls) == 3
+
+
+def test_call_with_backoff_raises_other_errors_at_once(monkeypatch):
+    monkeypatch.setattr(time, "sleep", lambda seconds: None)
+    fn, calls = flaky([ValueError("bad request")])
+    with pytest.raises(ValueError):
+        RateLimiter(requests_per_minute=60000).call_with_backoff(fn, "test")
+    assert len(calls) == 1
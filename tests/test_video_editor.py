@@ -0,0 +1,102 @@
+"""
+Segment rendering and stitching with VideoEditor, on tiny pages and short narration.
+"""
+import os
+import numpy as np
+import pytest
+from PIL import Image
+from wav_writer import StreamingWavWriter
+from instrumentation import tracer
+from video_editor import VideoEditor
+
+SCREEN_SIZE = (160, 90)
+
+
+def narration(path, seconds=1.0, sample_rate=24000):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    with StreamingWavWriter(str(path), sample_rate=sample_rate) as writer:
+        writer.write((8000 * np.sin(2 * np.pi * 220 * t)).astype("<i2").tobytes())
+    return str(path)
+
+
+def make_batches(tmp_path, count=3, broken=()):
+    """
+    `count` one-page batches; the segments numbered in `broken` point at a file that is not an image.
+    """
+    batches = []
+    for n in range(1, count + 1):
+        image_path = tmp_path / f"page_{n}.png"
+        if n in broken:
+            image_path.write_text("not an image")
+        else:
+            Image.new("RGB", (60, 90), (60 * n, 90, 150)).save(image_path)
+        batches.append({"segment": n, "audio_path": narration(tmp_path / f"segment_{n}.wav"),
+                        "items": [{"image_path": str(image_path), "script": f"Segment {n}"}],
+                        "segment_script": f"Segment {n}", "mood": "Neutral"})
+    return batches
+
+
+def make_editor(tmp_path):
+    return VideoEditor(output_dir=str(tmp_path / "output"), screen_size=SCREEN_SIZE,
+                       background_cache_dir=str(tmp_path / "backgrounds"), music_cache_dir=None)
+
+
+def test_segments_render_and_stitch(tmp_path):
+    editor = make_editor(tmp_path)
+    path = editor.create_video_as_ready(enumerate(make_batches(tmp_path)), "recap.mp4", workers=1)
+    assert path == str(tmp_path / "output" / "recap.mp4")
+    assert os.path.getsize(path) > 0
+
+
+def test_failed_segment_fails_the_render_and_keeps_the_others(tmp_path):
+    editor = make_editor(tmp_path)
+    batches = make_batches(tmp_path, broken={2})
+    with pytest.raises(RuntimeError, match=r"1 segment\(s\) failed to render \(2\)"):
+        editor.create_video_as_ready(enumerate(batches), "recap.mp4", workers=1)
+
+    assert not os.path.exists(tmp_path / "output" / "recap.mp4")
+    # Segments 1 and 3 are finished for a re-run; nothing of the failed encode is left
+    segments = sorted(os.listdir(tmp_path / "output" / "segments"))
+    expected = sorted(f"{editor.segment_fingerprint(batches[i])}.mp4" for i in (0, 2))
+    assert segments == expected
+
+
+def test_render_workers_report_their_resource_usage(tmp_path):
+    editor = make_editor(tmp_path)
+    editor.create_video_as_ready(enumerate(make_batches(tmp_path, count=1)), "recap.mp4", workers=1)
+
+    # Forkserver workers are not children of this process; their usage comes back with the result
+    usage = tracer.workers_usage()
+    assert usage["cpu_s"] > 0 and usage["maxrss_mb"] > 0 and usage["children_maxrss_mb"] > 0
+    peaks = tracer.report()["peak_rss_mb"]
+    assert peaks["workers"] >= round(usage["maxrss_mb"], 1) and "worker_children" in peaks
+
+
+def test_unchanged_segments_are_reused(tmp_path, capsys):
+    editor = make_editor(tmp_path)
+    batches = make_batches(tmp_path)
+    editor.create_video_as_ready(enumerate(batches), "recap.mp4", workers=1)
+    assert "(0 reused)" in capsys.readouterr().out
+
+    # New narration for segment 2 only
+    narration(batches[1]["audio_path"], seconds=0.5)
+    editor.create_video_as_ready(enumerate(batches), "recap.mp4", workers=1)
+    out = capsys.readouterr().out
+    assert "(2 reused)" in out and "Segment 2 rendered" in out
+    assert "Segment 1 rendered" not in out and "Segment 3 rendered" not in out
+
+
+def test_preview_renders_only_the_chosen_segments(tmp_path):
+    editor = VideoEditor.for_preview(output_dir=str(tmp_path / "previews"), screen_size=SCREEN_SIZE,
+                                     background_cache_dir=str(tmp_path / "backgrounds"))
+    assert editor.screen_size == (640, 360) and editor.fps == 12 and editor.encoder_profile == "draft"
+
+    batches = make_batches(tmp_path)
+    # Segment 2 is told apart by its shorter narration
+    narration(batches[1]["audio_path"], seconds=0.5)
+    tracer.drain()
+    path = editor.create_preview(batches, "preview.mp4", segments=[2, 7])
+    assert os.path.getsize(path) > 0
+    spans = {s["name"]: s["attrs"] for s in tracer.drain()}
+    assert spans["render.preview"]["batches"] == 1
+    assert spans["render.encode"]["pages"] == 1 and spans["render.encode"]["frames"] == 6
@@ -0,0 +1,157 @@
+"""
+Segment validation, window planning and merging, streamed analysis recovery and upload
+reuse, offline: the Gemini client is fake_backend.FakeGemini.
+"""
+import re
+import json
+from datetime import datetime, timedelta, timezone
+from google.genai import types
+from fake_backend import FakeGemini
+from vision_agent import VisionAgent, validate_segment, plan_windows, merge_windows
+
+
+def segment(start, end, script="Narration.", mood="Action"):
+    return {"start_page": start, "end_page": end, "script": script, "mood": mood}
+
+
+def test_validate_segment_normalizes_fields():
+    seg = validate_segment({"start_page": "2", "end_page": 4, "script": "  Text ", "mood": "happy"}, 1, 10)
+    assert seg == {"start_page": 2, "end_page": 4, "script": "Text", "mood": "Happy", "style_instructions": ""}
+
+
+def test_validate_segment_clamps_overlap_with_previous_segment():
+    # 3-5 right after 1-3: the repeated page is dropped instead of the whole segment
+    assert validate_segment(segment(3, 5), 4, 10)["start_page"] == 4
+
+
+def test_validate_segment_rejects_invalid_items():
+    assert validate_segment("not a dict", 1, 10) is None
+    assert validate_segment(segment(1, 3), 4, 10) is None  # entirely before first_page
+    assert validate_segment(segment(5, 11), 1, 10) is None  # past last_page
+    assert validate_segment(segment(4, 3), 1, 10) is None
+    assert validate_segment(segment(1, 2, mood="Romance"), 1, 10) is None
+    assert validate_segment(segment(1, 2, script="  "), 1, 10) is None
+    assert validate_segment({"end_page": 2, "script": "x", "mood": "Sad"}, 1, 10) is None
+
+
+def test_plan_windows_overlap_and_cover_every_page():
+    assert plan_windows(10, 4, 1) == [(1, 4), (4, 7), (7, 10)]
+    assert plan_windows(3, 40, 4) == [(1, 3)]
+    # An overlap as large as the window still advances
+    assert plan_windows(4, 2, 2) == [(1, 2), (2, 3), (3, 4)]
+
+
+def test_merge_windows_splits_overlaps_and_makes_ranges_contiguous():
+    windows = [(1, 6), (5, 10)]
+    window_segments = [
+        [segment(2, 3, "a"), segment(4, 5, "b"), segment(6, 6, "dropped: owned by window 2")],
+        [segment(5, 6, "dropped: owned by window 1"), segment(7, 10, "c")],
+    ]
+    merged = merge_windows(windows, window_segments, page_count=10)
+    assert [(s["script"], s["start_page"], s["end_page"]) for s in merged] == [
+        ("a", 1, 3), ("b", 4, 6), ("c", 7, 10)]
+
+
+class TruncatingGemini(FakeGemini):
+    """
+    FakeGemini whose next analysis responses are cut off after `cuts[i]` complete segments.
+    """
+
+    def __init__(self, cuts, **kwargs):
+        super().__init__(**kwargs)
+        self.cuts = list(cuts)
+        self.requested_pages = []
+
+    def respond(self, model, contents, config):
+        chunks = list(super().respond(model, contents, config))
+        if "tts" in model or (config is not None and config.response_mime_type == "text/plain"):
+            yield from chunks
+            return
+        prompt = contents if isinstance(contents, str) else "\n".join(
+            part.text for content in contents if not isinstance(content, str)
+            for part in content.parts or [] if part.text)
+        pages = re.search(r"pages (\d+) to (\d+)", prompt)
+        self.requested_pages.append((int(pages.group(1)), int(pages.group(2))) if pages else None)
+        text = "".join(chunk.candidates[0].content.parts[0].text for chunk in chunks)
+        if self.cuts:
+            # Keep `cut` whole objects and half of the next one
+            objects = json.loads(text)
+            cut = self.cuts.pop(0)
+            text = "[" + ", ".join(json.dumps(obj) for obj in objects[:cut] + [objects[cut]])
+            text = text[:len(text) - 20]
+        yield types.GenerateContentResponse(candidates=[types.Candidate(
+            content=types.Content(role="model", parts=[types.Part(text=text)]))])
+
+
+def make_agent(client, tmp_path):
+    tmp_path.mkdir(parents=True, exist_ok=True)
+    pdf_path = tmp_path / "chapter.pdf"
+    pdf_path.write_bytes(b"%PDF offline stand-in")
+    agent = VisionAgent(client=client, cache_dir=str(tmp_path / "vision"),
+                        upload_registry=str(tmp_path / "uploads.json"), window_pages=None,
+                        requests_per_minute=60000)
+    return agent, str(pdf_path)
+
+
+def test_cut_off_analysis_requests_only_the_missing_pages(tmp_path):
+    gemini = TruncatingGemini(cuts=[2], page_count=12, pages_per_segment=3)
+    agent, pdf_path = make_agent(gemini, tmp_path)
+    streamed = []
+    segments = agent.analyze_pdf(pdf_path, page_count=12, on_segment=lambda i, seg: streamed.append(i))
+
+    assert [(s["start_page"], s["end_page"]) for s in segments] == [(1, 3), (4, 6), (7, 9), (10, 12)]
+    assert streamed == [0, 1, 2, 3]
+    assert gemini.requested_pages == [None, (7, 12)]
+    # Complete, so cached: a second call makes no request
+    assert agent.analyze_pdf(pdf_path, page_count=12) == segments
+    assert len(gemini.requested_pages) == 2
+
+
+def test_analysis_keeps_segments_received_when_retries_run_out(tmp_path):
+    gemini = TruncatingGemini(cuts=[1, 0, 0], page_count=9, pages_per_segment=3)
+    agent, pdf_path = make_agent(gemini, tmp_path)
+    segments = agent.analyze_pdf(pdf_path, page_count=9)
+
+    assert [(s["start_page"], s["end_page"]) for s in segments] == [(1, 3)]
+    assert gemini.requested_pages == [None, (4, 9), (4, 9)]
+    # Incomplete analyses are not cached
+    assert not list((tmp_path / "vision").glob("*.json"))
+
+
+def test_uploads_are_reused_across_agents(tmp_path):
+    gemini = FakeGemini()
+    agent, pdf_path = make_agent(gemini, tmp_path)
+    first = agent.upload(pdf_path)
+    again = make_agent(gemini, tmp_path)[0].upload(pdf_path)
+    assert again.name == first.name
+    assert gemini.calls["upload"] == 1
+
+
+def test_expiring_uploads_are_replaced(tmp_path):
+    gemini = FakeGemini()
+    agent, pdf_path = make_agent(gemini, tmp_path)
+    first = agent.upload(pdf_path)
+    # Inside UPLOAD_EXPIRY_MARGIN
+    gemini.files.uploaded[first.name].expiration_time = datetime.now(timezone.utc) + timedelta(minutes=5)
+    registry = json.loads((tmp_path / "uploads.json").read_text())
+    for entry in registry.values():
+        entry["expiration_time"] = (datetime.now(timezone.utc) + timedelta(minutes=5)).isoformat()
+    (tmp_path / "uploads.json").write_text(json.dumps(registry))
+
+    assert agent.upload(pdf_path).name != first.name
+    assert gemini.calls["upload"] == 2
+
+
+def test_failed_or_stuck_uploads_are_replaced(tmp_path):
+    for state in (types.FileState.FAILED, types.FileState.PROCESSING):
+        gemini = FakeGemini()
+        agent, pdf_path = make_agent(gemini, tmp_path / state.name)
+        agent.processing_timeout = 0
+        first = agent.upload(pdf_path)
+        gemini.files.uploaded[first.name].state = state
+
+        replacement = agent.upload(pdf_path)
+        assert replacement.name != first.name
+        assert gemini.calls["upload"] == 2
+        registry = json.loads((tmp_path / state.name / "uploads.json").read_text())
+        assert [entry["name"] for entry in registry.values()] == [replacement.name]
@@ -0,0 +1,55 @@
+"""
+StreamingWavWriter output and is_complete_wav's detection of interrupted writes.
+"""
+import wave
+from wav_writer import StreamingWavWriter, is_complete_wav, WAV_HEADER_SIZE
+
+PCM = bytes(range(256)) * 40
+
+
+def test_streamed_chunks_make_a_valid_wav(tmp_path):
+    path = str(tmp_path / "out.wav")
+    with StreamingWavWriter(path, sample_rate=24000, bits_per_sample=16, num_channels=2) as writer:
+        for i in range(0, len(PCM), 1000):
+            writer.write(PCM[i:i + 1000])
+
+    assert is_complete_wav(path)
+    with wave.open(path, "rb") as f:
+        assert (f.getframerate(), f.getsampwidth(), f.getnchannels()) == (24000, 2, 2)
+        assert f.readframes(f.getnframes()) == PCM
+
+
+def test_unfinished_write_is_incomplete(tmp_path):
+    path = str(tmp_path / "out.wav")
+    writer = StreamingWavWriter(path)
+    writer.write(PCM)
+    writer.file.flush()
+    # Header still carries the zero sizes reserved at open
+    assert not is_complete_wav(path)
+    writer.close()
+    assert is_complete_wav(path)
+
+
+def test_truncated_and_missing_files_are_incomplete(tmp_path):
+    path = tmp_path / "out.wav"
+    with StreamingWavWriter(str(path)) as writer:
+        writer.write(PCM)
+    path.write_bytes(path.read_bytes()[:-100])
+    assert not is_complete_wav(str(path))
+    assert not is_complete_wav(str(tmp_path / "missing.wav"))
+
+    with StreamingWavWriter(str(path)):
+        pass
+    assert path.stat().st_size == WAV_HEADER_SIZE
+    assert not is_complete_wav(str(path))  # no samples
+
+
+def test_passthrough_keeps_an_existing_container(tmp_path):
+    source = str(tmp_path / "source.wav")
+    with StreamingWavWriter(source) as writer:
+        writer.write(PCM)
+    copy = str(tmp_path / "copy.wav")
+    with StreamingWavWriter(copy, write_header=False) as writer:
+        writer.write(open(source, "rb").read())
+    assert open(copy, "rb").read() == open(source, "rb").read()
+    assert is_complete_wav(copy)